@@ -0,0 +1,461 @@
+#!/usr/bin/env python3
+"""
+공유 파일시스템 기반 분산 평가 (coordinator/worker)
+
+여러 호스트의 run.py 대신 사용할 수 있는 작업 큐입니다. 각 워커는 자신의
+VLLM_API_BASE로 다른 vLLM 클러스터에 붙을 수 있습니다.
+
+큐 디렉터리 구조:
+    manifest.json        평가 설정과 샤드 목록
+    shards/<id>.json     샤드별 질문
+    leases/<id>.lease    처리 중인 샤드의 lease (워커 ID, 파일 mtime이 heartbeat 시각)
+    partial/<id>.json    일부 질문만 답을 받은 샤드의 중간 결과
+    done/<id>.json       완료된 샤드 결과 (샤드의 모든 질문에 답이 있을 때만 기록)
+
+사용법:
+    python distributed.py init <queue_dir> <model> [--shard-size N]
+    python distributed.py worker <queue_dir> [--worker-id ID] [--max-empty-shards N]
+    python distributed.py coordinator <queue_dir> <model>
+    python distributed.py merge <queue_dir>
+    python distributed.py local <queue_dir> <model> --workers N   # 로컬 다중 프로세스 테스트
+
+lease 만료 판정은 lease 파일의 mtime으로 하므로 호스트(및 파일 서버) 간 시계가
+대략 맞아야 합니다.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+MANIFEST_NAME = "manifest.json"
+DEFAULT_LEASE_TTL = 120  # heartbeat가 이 시간(초) 이상 없으면 샤드를 다시 큐에 넣음
+DEFAULT_MAX_EMPTY_SHARDS = 3  # 연속으로 이만큼 샤드에서 답을 하나도 못 받으면 워커 종료
+POLL_INTERVAL = 5
+
+
+def _shard_path(queue_dir, shard_id):
+    return os.path.join(queue_dir, "shards", f"{shard_id}.json")
+
+
+def _lease_path(queue_dir, shard_id):
+    return os.path.join(queue_dir, "leases", f"{shard_id}.lease")
+
+
+def _done_path(queue_dir, shard_id):
+    return os.path.join(queue_dir, "done", f"{shard_id}.json")
+
+
+def _partial_path(queue_dir, shard_id):
+    return os.path.join(queue_dir, "partial", f"{shard_id}.json")
+
+
+def _write_json_atomic(path, obj):
+    """임시 파일에 쓴 뒤 rename하여 다른 프로세스가 반쯤 쓰인 파일을 읽지 않도록 함"""
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(obj, f)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_manifest(queue_dir):
+    return _read_json(os.path.join(queue_dir, MANIFEST_NAME))
+
+
+def init_queue(queue_dir, model, questions_path="TeleQnA.txt", shard_size=200,
+               n_questions=5, max_attempts=5, n_samples=1, save_path=None):
+    """데이터셋을 샤드로 나누고 manifest를 작성 (이미 있으면 기존 큐를 그대로 사용)"""
+    manifest_path = os.path.join(queue_dir, MANIFEST_NAME)
+    if os.path.exists(manifest_path):
+        print(f"Queue already initialized at {queue_dir}")
+        return load_manifest(queue_dir)
+
+    if save_path is None:
+        # run.py와 같은 규칙: self-consistency 결과는 별도 파일
+        save_suffix = f"_sc{n_samples}" if n_samples > 1 else ""
+        save_path = os.path.join(model+save_suffix+"_answers.txt")
+
+    for sub_dir in ("shards", "leases", "partial", "done"):
+        os.makedirs(os.path.join(queue_dir, sub_dir), exist_ok=True)
+
+    with open(questions_path, encoding="utf-8") as f:
+        all_questions = json.load(f)
+
+    # 기존 결과가 있다면 이미 처리된 질문 제외 (run.py의 resume과 동일)
+    if os.path.exists(save_path):
+        existing_results = _read_json(save_path)
+        all_questions = {q: v for q, v in all_questions.items() if q not in existing_results}
+        print(f"Resuming from {save_path}. {len(all_questions)} questions remaining.")
+
+    q_names = list(all_questions)
+    shard_ids = []
+    for start_id in range(0, len(q_names), shard_size):
+        shard_id = f"shard_{start_id // shard_size:05d}"
+        shard_questions = {q: all_questions[q] for q in q_names[start_id:start_id + shard_size]}
+        _write_json_atomic(_shard_path(queue_dir, shard_id), shard_questions)
+        shard_ids.append(shard_id)
+
+    manifest = {
+        "model": model,
+        "save_path": save_path,
+        "n_questions": n_questions,
+        "max_attempts": max_attempts,
+        "n_samples": n_samples,
+        "shards": shard_ids,
+        "created": time.time()
+    }
+    # manifest는 마지막에 써서 워커가 불완전한 큐를 보지 않도록 함
+    _write_json_atomic(manifest_path, manifest)
+    print(f"Created {len(shard_ids)} shards of up to {shard_size} questions in {queue_dir}")
+    return manifest
+
+
+def try_claim_shard(queue_dir, shard_id, worker_id):
+    """O_EXCL로 lease 파일을 생성해 샤드를 원자적으로 점유 (성공 시 True)"""
+    try:
+        fd = os.open(_lease_path(queue_dir, shard_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        # token은 같은 워커가 같은 샤드를 다시 점유한 경우까지 구분하기 위한 점유별 ID
+        json.dump({"worker": worker_id, "claimed_at": time.time(), "token": uuid.uuid4().hex}, f)
+    return True
+
+
+def release_lease(queue_dir, shard_id, token=None):
+    """lease를 제거 (token을 주면 그 점유의 lease일 때만 제거하고 다른 점유의 lease는 되돌려 둠)"""
+    lease_path = _lease_path(queue_dir, shard_id)
+    released_path = f"{lease_path}.released.{uuid.uuid4().hex}"
+    try:
+        os.rename(lease_path, released_path)
+    except FileNotFoundError:
+        return
+    if token is not None and _read_json(released_path).get("token") != token:
+        try:
+            os.link(released_path, lease_path)
+        except FileExistsError:
+            pass
+    os.remove(released_path)
+
+
+def read_lease(queue_dir, shard_id):
+    """lease 내용을 읽음 (없거나 쓰는 중이면 None)"""
+    try:
+        return _read_json(_lease_path(queue_dir, shard_id))
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _lease_age(path):
+    return time.time() - os.stat(path).st_mtime
+
+
+def requeue_expired_leases(queue_dir, lease_ttl=DEFAULT_LEASE_TTL):
+    """heartbeat(lease 파일 mtime)가 끊긴 lease를 제거해 샤드를 다시 점유 가능하게 만듦"""
+    requeued = []
+    for shard_id in load_manifest(queue_dir)["shards"]:
+        if os.path.exists(_done_path(queue_dir, shard_id)):
+            continue
+        lease_path = _lease_path(queue_dir, shard_id)
+        try:
+            if _lease_age(lease_path) <= lease_ttl:
+                continue
+        except FileNotFoundError:
+            continue
+        # rename은 원자적이므로 여러 프로세스가 동시에 만료 처리해도 하나만 성공
+        expired_path = f"{lease_path}.expired.{uuid.uuid4().hex}"
+        try:
+            os.rename(lease_path, expired_path)
+        except FileNotFoundError:
+            continue
+        # 검사와 rename 사이에 heartbeat가 들어왔다면 되돌림 (link는 이미 새 lease가 있으면 실패)
+        if _lease_age(expired_path) <= lease_ttl:
+            try:
+                os.link(expired_path, lease_path)
+            except FileExistsError:
+                pass
+            os.remove(expired_path)
+            continue
+        try:
+            with open(expired_path, encoding="utf-8") as f:
+                worker = json.load(f)["worker"]
+        except (ValueError, KeyError):
+            worker = "unknown worker"
+        os.remove(expired_path)
+        print(f"Requeued {shard_id} (lease of {worker} expired)")
+        requeued.append(shard_id)
+    return requeued
+
+
+class LeaseHeartbeat:
+    """처리 중인 샤드의 lease mtime을 주기적으로 갱신하는 백그라운드 스레드
+
+    lease 파일은 다시 쓰지 않고 mtime만 갱신하므로 다른 워커의 lease 내용을 덮어쓰지
+    않습니다. 현재 lease 파일의 token이 점유 시점과 다르면 (만료 처리된 뒤 다른 워커가
+    점유) lease를 잃은 것으로 봅니다. 확인과 갱신 사이에 lease가 바뀌면 새 lease의
+    mtime을 한 번 갱신할 수 있지만 내용은 바뀌지 않습니다.
+    """
+
+    def __init__(self, queue_dir, shard_id, worker_id, interval):
+        self.queue_dir = queue_dir
+        self.shard_id = shard_id
+        self.worker_id = worker_id
+        self.interval = interval
+        self.lost = False  # lease가 만료 처리되어 다른 워커에게 넘어갔는지
+        self._token = None
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _owns_lease(self):
+        lease = read_lease(self.queue_dir, self.shard_id)
+        return lease is not None and lease.get("token") == self._token
+
+    def _run(self):
+        lease_path = _lease_path(self.queue_dir, self.shard_id)
+        while not self._stop.wait(self.interval):
+            if not self._owns_lease():
+                self.lost = True
+                print(f"Lost lease on {self.shard_id}")
+                return
+            try:
+                os.utime(lease_path)
+            except FileNotFoundError:
+                pass  # 다음 주기에 lost로 판정
+
+    def __enter__(self):
+        lease = read_lease(self.queue_dir, self.shard_id)
+        if lease is None or lease["worker"] != self.worker_id:
+            self.lost = True
+        else:
+            self._token = lease.get("token")
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        if not self.lost and not self._owns_lease():
+            self.lost = True
+
+    def release(self):
+        """lease를 아직 갖고 있으면 제거해 샤드를 다른 워커가 점유할 수 있게 함"""
+        if not self.lost:
+            release_lease(self.queue_dir, self.shard_id, self._token)
+
+
+def run_worker(queue_dir, worker_id=None, lease_ttl=DEFAULT_LEASE_TTL, n_processes=None,
+               max_empty_shards=DEFAULT_MAX_EMPTY_SHARDS):
+    """남은 샤드가 없을 때까지 샤드를 점유해 평가하고 결과를 done/에 기록
+
+    샤드의 모든 질문에 답을 받았을 때만 done/에 기록합니다. 일부만 받았으면 받은 결과를
+    partial/에 남기고 lease를 풀어 (이 워커나 다른 워커가) 남은 질문만 다시 평가하게
+    합니다. 연속 max_empty_shards번 새 답을 하나도 받지 못하면 이 워커의 클러스터에
+    문제가 있다고 보고 종료합니다.
+    """
+    from evaluation_tools import check_questions_parallel
+
+    if worker_id is None:
+        worker_id = f"{socket.gethostname()}-{os.getpid()}"
+    if n_processes is None:
+        n_processes = int(os.getenv("VLLM_PROCESSES", "4"))
+
+    manifest = load_manifest(queue_dir)
+    print(f"Worker {worker_id} started on {queue_dir} (model {manifest['model']})")
+
+    processed = 0
+    empty_shards = 0
+    while True:
+        requeue_expired_leases(queue_dir, lease_ttl)
+
+        pending = [s for s in manifest["shards"] if not os.path.exists(_done_path(queue_dir, s))]
+        if not pending:
+            break
+
+        claimed = next((s for s in pending if try_claim_shard(queue_dir, s, worker_id)), None)
+        if claimed is None:
+            # 남은 샤드는 모두 다른 워커가 처리 중: 완료되거나 lease가 만료될 때까지 대기
+            time.sleep(POLL_INTERVAL)
+            continue
+
+        with LeaseHeartbeat(queue_dir, claimed, worker_id, interval=lease_ttl / 3) as heartbeat:
+            # pending 계산과 점유 사이에 다른 워커가 샤드를 끝냈을 수 있음
+            if os.path.exists(_done_path(queue_dir, claimed)):
+                heartbeat.release()
+                continue
+
+            shard_questions = _read_json(_shard_path(queue_dir, claimed))
+            partial_path = _partial_path(queue_dir, claimed)
+            answered = _read_json(partial_path) if os.path.exists(partial_path) else {}
+            remaining = {q: v for q, v in shard_questions.items() if q not in answered}
+            print(f"Worker {worker_id} claimed {claimed} ({len(remaining)}/{len(shard_questions)} questions remaining)")
+
+            results = check_questions_parallel(
+                remaining,
+                manifest["model"],
+                n_questions=manifest["n_questions"],
+                max_attempts=manifest["max_attempts"],
+                n_processes=n_processes,
+                n_samples=manifest["n_samples"]
+            )
+        answered.update(results)
+
+        if len(answered) == len(shard_questions):
+            # lease를 잃었더라도 완전한 결과는 유효하므로 기록 (중복 처리 시 마지막 기록이 남음)
+            _write_json_atomic(_done_path(queue_dir, claimed), answered)
+            if not heartbeat.lost:
+                try:
+                    os.remove(partial_path)
+                except FileNotFoundError:
+                    pass
+            processed += 1
+            print(f"Worker {worker_id} finished {claimed}")
+        elif heartbeat.lost:
+            # 샤드는 이미 다른 워커 소유: partial/을 동시에 갱신하지 않도록 이번 결과는 버림
+            print(f"Worker {worker_id} dropped {len(results)} results for {claimed} after losing the lease")
+        else:
+            if results:
+                os.makedirs(os.path.dirname(partial_path), exist_ok=True)  # partial/ 이전에 만든 큐
+                _write_json_atomic(partial_path, answered)
+            print(f"Worker {worker_id} released {claimed} ({len(answered)}/{len(shard_questions)} questions answered)")
+        heartbeat.release()
+
+        empty_shards = 0 if results else empty_shards + 1
+        if empty_shards >= max_empty_shards:
+            print(f"Worker {worker_id} giving up after {empty_shards} shards without any answer "
+                  f"(check the vLLM cluster at this worker's VLLM_API_BASE)")
+            break
+
+    print(f"Worker {worker_id} exiting, processed {processed} shards")
+    return processed
+
+
+def merge_results(queue_dir):
+    """완료된 샤드와 일부만 끝난 샤드의 결과를 기존 결과와 합쳐 표준 <model>_answers.txt로 저장
+
+    partial/의 결과도 합치므로 모든 샤드가 끝나기 전에 병합해도 받은 답은 보존되며,
+    run.py나 init으로 다시 실행하면 남은 질문만 평가합니다.
+    """
+    manifest = load_manifest(queue_dir)
+    save_path = manifest["save_path"]
+
+    results = _read_json(save_path) if os.path.exists(save_path) else {}
+    merged_shards = 0
+    partial_shards = 0
+    for shard_id in manifest["shards"]:
+        done_path = _done_path(queue_dir, shard_id)
+        partial_path = _partial_path(queue_dir, shard_id)
+        if os.path.exists(done_path):
+            results.update(_read_json(done_path))
+            merged_shards += 1
+        elif os.path.exists(partial_path):
+            results.update(_read_json(partial_path))
+            partial_shards += 1
+
+    _write_json_atomic(save_path, results)
+    print(f"Merged {merged_shards}/{len(manifest['shards'])} shards ({partial_shards} partial) "
+          f"into {save_path} ({len(results)} questions)")
+    return results
+
+
+def queue_progress(queue_dir):
+    """(완료 샤드 수, 처리 중 샤드 수, 전체 샤드 수)"""
+    shards = load_manifest(queue_dir)["shards"]
+    done = sum(os.path.exists(_done_path(queue_dir, s)) for s in shards)
+    leased = sum(os.path.exists(_lease_path(queue_dir, s)) and not os.path.exists(_done_path(queue_dir, s)) for s in shards)
+    return done, leased, len(shards)
+
+
+def run_coordinator(queue_dir, lease_ttl=DEFAULT_LEASE_TTL, workers=()):
+    """만료된 lease를 재배치하며 모든 샤드가 끝날 때까지 기다린 뒤 결과를 병합
+
+    workers에 로컬 워커 프로세스(subprocess.Popen)를 넘기면 모두 종료되었는데
+    샤드가 남은 경우 대기하지 않고 멈춥니다.
+    """
+    while True:
+        requeue_expired_leases(queue_dir, lease_ttl)
+        done, leased, total = queue_progress(queue_dir)
+        print(f"Progress: {done}/{total} shards done, {leased} in progress")
+        if done == total:
+            break
+        if workers and all(w.poll() is not None for w in workers):
+            print("All local workers exited before the queue was drained")
+            break
+        time.sleep(POLL_INTERVAL)
+
+    return merge_results(queue_dir)
+
+
+def run_local(queue_dir, n_workers, lease_ttl=DEFAULT_LEASE_TTL):
+    """같은 호스트에서 워커 프로세스 여러 개를 띄워 전체 흐름을 실행 (테스트용)"""
+    workers = []
+    for i in range(n_workers):
+        cmd = [sys.executable, os.path.abspath(__file__), "worker", queue_dir,
+               "--worker-id", f"local-{i}", "--lease-ttl", str(lease_ttl)]
+        workers.append(subprocess.Popen(cmd))
+
+    try:
+        return run_coordinator(queue_dir, lease_ttl, workers)
+    finally:
+        for w in workers:
+            w.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed TeleQnA evaluation over a shared filesystem work queue")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_init_args(p):
+        p.add_argument("queue_dir")
+        p.add_argument("model")
+        p.add_argument("--questions", default="TeleQnA.txt")
+        p.add_argument("--shard-size", type=int, default=200)
+        p.add_argument("--n-questions", type=int, default=5)
+        p.add_argument("--max-attempts", type=int, default=5)
+        p.add_argument("--n-samples", type=int, default=int(os.getenv("VLLM_N_SAMPLES", "1")))
+        p.add_argument("--lease-ttl", type=float, default=DEFAULT_LEASE_TTL)
+
+    add_init_args(sub.add_parser("init", help="Split the dataset into shards"))
+    add_init_args(sub.add_parser("coordinator", help="Initialize, requeue expired shards and merge when done"))
+    local_parser = sub.add_parser("local", help="Run coordinator and N local worker processes")
+    add_init_args(local_parser)
+    local_parser.add_argument("--workers", type=int, default=2)
+
+    worker_parser = sub.add_parser("worker", help="Claim and evaluate shards")
+    worker_parser.add_argument("queue_dir")
+    worker_parser.add_argument("--worker-id")
+    worker_parser.add_argument("--lease-ttl", type=float, default=DEFAULT_LEASE_TTL)
+    worker_parser.add_argument("--processes", type=int)
+    worker_parser.add_argument("--max-empty-shards", type=int, default=DEFAULT_MAX_EMPTY_SHARDS,
+                               help="Exit after this many consecutive shards without any answer")
+
+    merge_parser = sub.add_parser("merge", help="Merge completed and partial shards into <model>_answers.txt")
+    merge_parser.add_argument("queue_dir")
+
+    args = parser.parse_args(argv)
+
+    if args.command in ("init", "coordinator", "local"):
+        init_queue(args.queue_dir, args.model, questions_path=args.questions, shard_size=args.shard_size,
+                   n_questions=args.n_questions, max_attempts=args.max_attempts, n_samples=args.n_samples)
+        if args.command == "coordinator":
+            run_coordinator(args.queue_dir, args.lease_ttl)
+        elif args.command == "local":
+            run_local(args.queue_dir, args.workers, args.lease_ttl)
+    elif args.command == "worker":
+        run_worker(args.queue_dir, args.worker_id, args.lease_ttl, args.processes, args.max_empty_shards)
+    elif args.command == "merge":
+        merge_results(args.queue_dir)
+
+
+if __name__ == "__main__":
+    main()
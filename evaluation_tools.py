@@ -1,21 +1,29 @@
-from copy import deepcopy
 import json
-import requests
 import ast
+import pickle
 import re
 from multiprocessing import Pool, cpu_count
 from functools import partial
 import time
+import random
+import math
+import itertools
+from collections import Counter
+from records import QuestionRecord, ResultRecord, as_question_records
+from scheduling import SCHEDULERS, LPTScheduler, batch_features
+from profiling import profile_stage, add_count, enabled as profiling_enabled
 
 # vLLM API 설정 - 환경 변수로 오버라이드 가능
 import os
 API_BASE_URL = os.getenv("VLLM_API_BASE", "http://localhost:8000/v1")  # vLLM 서버 주소
 API_KEY = os.getenv("VLLM_API_KEY", "EMPTY")  # vLLM에서는 보통 빈 문자열 또는 "EMPTY" 사용
-
-print(f"Using vLLM API endpoint: {API_BASE_URL}")
+SELF_CONSISTENCY_TEMPERATURE = float(os.getenv("VLLM_SC_TEMPERATURE", "0.7"))  # self-consistency 샘플링 온도
+DEFAULT_MAX_TOKENS = 4096
 
 def get_available_models():
     """vLLM 서버에서 사용 가능한 모델 목록을 가져옵니다."""
+    import requests  # 시작 시간 단축을 위해 네트워크 사용 시점에 import
+    
     try:
         headers = {
             "Authorization": f"Bearer {API_KEY}",
@@ -92,25 +100,185 @@ Please provide the answers to the following telecommunications related multiple
 }
 """
 
-def check_questions_with_val_output(questions_dict, model):
-    questions_only = deepcopy(questions_dict)
-    answers_only = {}
-    for q in questions_dict:
-        answers_only[q] = {
-            "question": questions_dict[q]["question"],
-            "answer": questions_dict[q]["answer"]
-        }
+def extract_json_from_codeblock(text):
+    """다양한 형태의 코드 블록에서 JSON 추출"""
+    # 여러 마커 패턴 시도
+    patterns = [
+        r'```json\s*(.*?)\s*```',
+        r'```JSON\s*(.*?)\s*```', 
+        r'```\s*\{(.*?)\}\s*```',
+        r'```\s*(.*?)\s*```'
+    ]
+    
+    for pattern in patterns:
+        matches = re.findall(pattern, text, re.DOTALL | re.IGNORECASE)
+        if matches:
+            json_content = matches[0].strip()
+            if json_content.startswith('{'):
+                return json_content
+            # 중괄호가 없으면 추가
+            elif '{' in json_content and '}' in json_content:
+                start_brace = json_content.find('{')
+                return json_content[start_brace:]
+    
+    return text
+
+# 강화된 JSON 파싱 함수
+def robust_json_parse(json_str):
+    """다양한 방법으로 JSON 파싱 시도"""
+    parsing_attempts = []
+    
+    # 방법 1: 기본 json.loads
+    try:
+        result = json.loads(json_str)
+        parsing_attempts.append(("json.loads", "success"))
+        return result, parsing_attempts
+    except json.JSONDecodeError as e:
+        parsing_attempts.append(("json.loads", f"failed: {str(e)[:100]}"))
+    
+    # 방법 2: ast.literal_eval
+    try:
+        result = ast.literal_eval(json_str)
+        parsing_attempts.append(("ast.literal_eval", "success"))
+        return result, parsing_attempts
+    except (ValueError, SyntaxError) as e:
+        parsing_attempts.append(("ast.literal_eval", f"failed: {str(e)[:100]}"))
     
-        questions_only[q].pop("answer")
+    # 방법 3: JSON 정리 후 재시도
+    try:
+        # 여러 정리 작업 수행
+        cleaned_str = json_str.strip()
+        # 마지막 쉼표 제거
+        cleaned_str = re.sub(r',\s*}', '}', cleaned_str)
+        cleaned_str = re.sub(r',\s*]', ']', cleaned_str)
+        # 누락된 따옴표 수정 시도
+        cleaned_str = re.sub(r'(\w+):', r'"\1":', cleaned_str)
+        # 잘못된 따옴표 수정
+        cleaned_str = cleaned_str.replace("'", '"')
+        
+        result = json.loads(cleaned_str)
+        parsing_attempts.append(("cleaned_json", "success"))
+        return result, parsing_attempts
+    except json.JSONDecodeError as e:
+        parsing_attempts.append(("cleaned_json", f"failed: {str(e)[:100]}"))
+    
+    # 방법 4: 정규식을 이용한 강제 파싱
+    try:
+        # question 패턴 추출
+        question_pattern = r'"question\s*(\d+)"\s*:\s*\{[^}]*"question"\s*:\s*"([^"]+)"\s*,\s*"answer"\s*:\s*"([^"]+)"\s*\}'
+        matches = re.findall(question_pattern, json_str, re.IGNORECASE | re.DOTALL)
         
-        if 'explanation' in questions_only[q]:
-            questions_only[q].pop('explanation')
+        if matches:
+            result = {}
+            for q_num, question, answer in matches:
+                key = f"question {q_num}"
+                result[key] = {
+                    "question": question.strip(),
+                    "answer": answer.strip()
+                }
+            parsing_attempts.append(("regex_parsing", f"success: extracted {len(matches)} questions"))
+            return result, parsing_attempts
+        else:
+            parsing_attempts.append(("regex_parsing", "failed: no matches found"))
+    except Exception as e:
+        parsing_attempts.append(("regex_parsing", f"failed: {str(e)[:100]}"))
+    
+    return None, parsing_attempts
 
-        if 'category' in questions_only:
-            questions_only[q].pop('category')
+# 응답 형식 정규화 및 검증
+def normalize_answer_format(answers_dict):
+    """응답 형식을 정규화하고 검증"""
+    normalized = {}
+    for q_key, q_data in answers_dict.items():
+        if isinstance(q_data, dict):
+            # 필수 필드 확인
+            if "question" in q_data and "answer" in q_data:
+                normalized[q_key] = {
+                    "question": str(q_data["question"]).strip(),
+                    "answer": str(q_data["answer"]).strip()
+                }
+            # question 필드가 없는 경우 추론 시도
+            elif "answer" in q_data:
+                normalized[q_key] = {
+                    "question": "Unknown question",
+                    "answer": str(q_data["answer"]).strip()
+                }
+        # 단순 문자열인 경우 answer로 처리
+        elif isinstance(q_data, str):
+            normalized[q_key] = {
+                "question": "Unknown question", 
+                "answer": q_data.strip()
+            }
+    return normalized
+
+def parse_predicted_answers(predicted_answers_str):
+    """모델 응답 문자열 하나를 {question key: {question, answer}} 형태로 파싱"""
+    # 코드 블록 처리 개선
+    if "```" in predicted_answers_str:
+        predicted_answers_str = extract_json_from_codeblock(predicted_answers_str)
     
+    # JSON 정리 및 파싱 시도
+    predicted_answers_str = predicted_answers_str.replace('"\n', '",\n')
+    predicted_answers_str = predicted_answers_str[predicted_answers_str.find("{"):]
+    
+    # 파싱 시도
+    parsed_predicted_answers, parsing_log = robust_json_parse(predicted_answers_str)
+    
+    # 파싱 실패 시 상세한 오류 정보 제공
+    if parsed_predicted_answers is None:
+        error_details = "\n".join([f"  {method}: {result}" for method, result in parsing_log])
+        raise Exception(f"Failed to parse JSON response after multiple attempts:\n{error_details}\n\nOriginal response: {predicted_answers_str[:500]}...")
+    
+    return normalize_answer_format(parsed_predicted_answers)
+
+def vote_predicted_answers(parsed_samples, n_samples=None):
+    """여러 샘플의 파싱 결과를 질문별 다수결로 합침 (self-consistency)
+
+    반환 형식은 단일 응답 파싱 결과와 같고, 질문마다 'votes'(답변별 득표수),
+    'samples'(유효한 표 수), 'agreement'(요청한 전체 샘플 n_samples 중 최다 득표
+    답변의 비율) 필드가 추가됩니다. 파싱에 실패하거나 답하지 않은 샘플도 분모에
+    포함되므로 일치율을 과대평가하지 않습니다.
+    """
+    if n_samples is None:
+        n_samples = len(parsed_samples)
+    
+    ballots = {}
+    for parsed in parsed_samples:
+        for q_key, q_data in parsed.items():
+            ballots.setdefault(q_key, []).append(q_data)
+    
+    voted = {}
+    for q_key, q_ballots in ballots.items():
+        votes = Counter(ballot["answer"] for ballot in q_ballots)
+        # 동률이면 먼저 등장한 답변 선택
+        majority_answer, majority_count = votes.most_common(1)[0]
+        majority_ballot = next(b for b in q_ballots if b["answer"] == majority_answer)
+        voted[q_key] = {
+            "question": majority_ballot["question"],
+            "answer": majority_answer,
+            "votes": dict(votes),
+            "samples": len(q_ballots),
+            "agreement": majority_count / n_samples
+        }
+    return voted
+
+def build_user_prompt(prompt_questions):
+    """프롬프트 뷰({question key: 질문/옵션 dict})로 user prompt 작성"""
     user_prompt = "Here are the questions: \n "
-    user_prompt += json.dumps(questions_only)
+    user_prompt += json.dumps(prompt_questions)
+    return user_prompt
+
+def request_predicted_answers(user_prompt, model, n_samples=1, temperature=None, max_tokens=DEFAULT_MAX_TOKENS):
+    """user prompt를 모델에 보내고 파싱된 답변을 반환 (채점은 하지 않음)
+
+    n_samples > 1 이면 self-consistency 모드: vLLM의 n 파라미터로 한 번의 요청에서
+    n_samples개의 응답을 받아 (prefill 공유) 질문별 다수결로 답을 정합니다.
+    """
+    import requests  # 시작 시간 단축을 위해 네트워크 사용 시점에 import
+    
+    # 샘플링 없이 n개를 받으면 모두 같은 답이 나오므로 self-consistency 모드의 기본 온도는 더 높게
+    if temperature is None:
+        temperature = 0.1 if n_samples == 1 else SELF_CONSISTENCY_TEMPERATURE
     
     # vLLM API 호출
     headers = {
@@ -124,176 +292,76 @@ def check_questions_with_val_output(questions_dict, model):
             {"role": "system", "content": syst_prompt},
             {"role": "user", "content": user_prompt}
         ],
-        "temperature": 0.1,
-        "max_tokens": 4096
+        "temperature": temperature,
+        "max_tokens": max_tokens
     }
+    if n_samples > 1:
+        payload["n"] = n_samples
     
-    response = requests.post(f"{API_BASE_URL}/chat/completions", 
-                           headers=headers, 
-                           json=payload,
-                           timeout=300)
-    
-    if response.status_code != 200:
-        raise Exception(f"API request failed with status {response.status_code}: {response.text}")
-    
-    generated_output = response.json()
-    predicted_answers_str = generated_output["choices"][0]["message"]["content"]
-
-    
-    # 코드 블록 처리 개선
-    def extract_json_from_codeblock(text):
-        """다양한 형태의 코드 블록에서 JSON 추출"""
-        # 여러 마커 패턴 시도
-        patterns = [
-            r'```json\s*(.*?)\s*```',
-            r'```JSON\s*(.*?)\s*```', 
-            r'```\s*\{(.*?)\}\s*```',
-            r'```\s*(.*?)\s*```'
-        ]
-        
-        for pattern in patterns:
-            matches = re.findall(pattern, text, re.DOTALL | re.IGNORECASE)
-            if matches:
-                json_content = matches[0].strip()
-                if json_content.startswith('{'):
-                    return json_content
-                # 중괄호가 없으면 추가
-                elif '{' in json_content and '}' in json_content:
-                    start_brace = json_content.find('{')
-                    return json_content[start_brace:]
-        
-        return text
-    
-    if "```" in predicted_answers_str:
-        predicted_answers_str = extract_json_from_codeblock(predicted_answers_str)
-    
-    # JSON 정리 및 파싱 시도
-    predicted_answers_str = predicted_answers_str.replace('"\n', '",\n')
-    predicted_answers_str = predicted_answers_str[predicted_answers_str.find("{"):]
-    
-    # 강화된 JSON 파싱 함수
-    def robust_json_parse(json_str):
-        """다양한 방법으로 JSON 파싱 시도"""
-        parsing_attempts = []
-        
-        # 방법 1: 기본 json.loads
-        try:
-            result = json.loads(json_str)
-            parsing_attempts.append(("json.loads", "success"))
-            return result, parsing_attempts
-        except json.JSONDecodeError as e:
-            parsing_attempts.append(("json.loads", f"failed: {str(e)[:100]}"))
-        
-        # 방법 2: ast.literal_eval
-        try:
-            result = ast.literal_eval(json_str)
-            parsing_attempts.append(("ast.literal_eval", "success"))
-            return result, parsing_attempts
-        except (ValueError, SyntaxError) as e:
-            parsing_attempts.append(("ast.literal_eval", f"failed: {str(e)[:100]}"))
+    with profile_stage("request"):
+        response = requests.post(f"{API_BASE_URL}/chat/completions", 
+                               headers=headers, 
+                               json=payload,
+                               timeout=300)
         
-        # 방법 3: JSON 정리 후 재시도
-        try:
-            # 여러 정리 작업 수행
-            cleaned_str = json_str.strip()
-            # 마지막 쉼표 제거
-            cleaned_str = re.sub(r',\s*}', '}', cleaned_str)
-            cleaned_str = re.sub(r',\s*]', ']', cleaned_str)
-            # 누락된 따옴표 수정 시도
-            cleaned_str = re.sub(r'(\w+):', r'"\1":', cleaned_str)
-            # 잘못된 따옴표 수정
-            cleaned_str = cleaned_str.replace("'", '"')
-            
-            result = json.loads(cleaned_str)
-            parsing_attempts.append(("cleaned_json", "success"))
-            return result, parsing_attempts
-        except json.JSONDecodeError as e:
-            parsing_attempts.append(("cleaned_json", f"failed: {str(e)[:100]}"))
+        if response.status_code != 200:
+            raise Exception(f"API request failed with status {response.status_code}: {response.text}")
         
-        # 방법 4: 정규식을 이용한 강제 파싱
-        try:
-            # question 패턴 추출
-            question_pattern = r'"question\s*(\d+)"\s*:\s*\{[^}]*"question"\s*:\s*"([^"]+)"\s*,\s*"answer"\s*:\s*"([^"]+)"\s*\}'
-            matches = re.findall(question_pattern, json_str, re.IGNORECASE | re.DOTALL)
-            
-            if matches:
-                result = {}
-                for q_num, question, answer in matches:
-                    key = f"question {q_num}"
-                    result[key] = {
-                        "question": question.strip(),
-                        "answer": answer.strip()
-                    }
-                parsing_attempts.append(("regex_parsing", f"success: extracted {len(matches)} questions"))
-                return result, parsing_attempts
-            else:
-                parsing_attempts.append(("regex_parsing", "failed: no matches found"))
-        except Exception as e:
-            parsing_attempts.append(("regex_parsing", f"failed: {str(e)[:100]}"))
-        
-        return None, parsing_attempts
+        generated_output = response.json()
     
-    # 파싱 시도
-    parsed_predicted_answers, parsing_log = robust_json_parse(predicted_answers_str)
+    # 응답 파싱 (정규식/JSON 폴백 포함) 및 self-consistency 투표
+    with profile_stage("parser"):
+        if n_samples == 1:
+            predicted_answers_str = generated_output["choices"][0]["message"]["content"]
+            return parse_predicted_answers(predicted_answers_str)
     
-    # 파싱 실패 시 상세한 오류 정보 제공
-    if parsed_predicted_answers is None:
-        error_details = "\n".join([f"  {method}: {result}" for method, result in parsing_log])
-        raise Exception(f"Failed to parse JSON response after multiple attempts:\n{error_details}\n\nOriginal response: {predicted_answers_str[:500]}...")
+        # 모든 choice를 파싱하고, 파싱에 실패한 샘플은 투표에서 제외
+        parsed_samples = []
+        parse_errors = []
+        for choice in generated_output["choices"]:
+            try:
+                parsed_samples.append(parse_predicted_answers(choice["message"]["content"]))
+            except Exception as e:
+                parse_errors.append(str(e))
     
-    # 응답 형식 정규화 및 검증
-    def normalize_answer_format(answers_dict):
-        """응답 형식을 정규화하고 검증"""
-        normalized = {}
-        for q_key, q_data in answers_dict.items():
-            if isinstance(q_data, dict):
-                # 필수 필드 확인
-                if "question" in q_data and "answer" in q_data:
-                    normalized[q_key] = {
-                        "question": str(q_data["question"]).strip(),
-                        "answer": str(q_data["answer"]).strip()
-                    }
-                # question 필드가 없는 경우 추론 시도
-                elif "answer" in q_data:
-                    normalized[q_key] = {
-                        "question": "Unknown question",
-                        "answer": str(q_data["answer"]).strip()
-                    }
-            # 단순 문자열인 경우 answer로 처리
-            elif isinstance(q_data, str):
-                normalized[q_key] = {
-                    "question": "Unknown question", 
-                    "answer": q_data.strip()
-                }
-        return normalized
+        if not parsed_samples:
+            raise Exception(f"Failed to parse JSON response in all {len(parse_errors)} samples:\n{parse_errors[0]}")
     
-    parsed_predicted_answers = normalize_answer_format(parsed_predicted_answers)
+        return vote_predicted_answers(parsed_samples, n_samples)
+
+def is_accepted(grading_view, predicted):
+    """모델 답변이 채점 뷰(질문, 정답)와 정확히 일치하는지"""
+    return predicted is not None and {"question": predicted["question"], "answer": predicted["answer"]} == grading_view
+
+def check_questions_with_val_output(questions_dict, model, n_samples=1, temperature=None, max_tokens=DEFAULT_MAX_TOKENS):
+    """질문 배치를 모델에 보내고 채점 (정답 질문 dict, 파싱된 답변) 반환"""
+    records = as_question_records(questions_dict)
+    user_prompt = build_user_prompt({record.name: record.prompt_view() for record in records})
+    parsed_predicted_answers = request_predicted_answers(user_prompt, model, n_samples, temperature, max_tokens)
     
     accepted_questions = {}
-    
-    for q in questions_dict:
-        if q in parsed_predicted_answers and q in answers_only:
-            if parsed_predicted_answers[q] == answers_only[q]:
-                accepted_questions[q] = questions_dict[q]
+    for record in records:
+        if is_accepted(record.grading_view(), parsed_predicted_answers.get(record.name)):
+            accepted_questions[record.name] = questions_dict[record.name]
 
     return accepted_questions, parsed_predicted_answers
 
 def process_single_question_batch(question_batch_data):
-    """단일 배치를 처리하는 함수 (멀티프로세스용)"""
-    batch_id, questions_dict, model, max_attempts = question_batch_data
+    """단일 배치를 처리하는 함수 (멀티프로세스용)
+
+    워커에는 질문 키와 완성된 prompt 문자열만 전달되고, 파싱된 답변만 돌려받습니다.
+    채점은 부모 프로세스에서 grade_batch로 합니다.
+    """
+    batch_id, q_names, user_prompt, model, max_attempts, n_samples, max_tokens = question_batch_data
     
     for attempt in range(max_attempts):
         try:
-            accepted_questions, parsed_predicted_answers = check_questions_with_val_output(questions_dict, model)
+            parsed_predicted_answers = request_predicted_answers(user_prompt, model, n_samples, max_tokens=max_tokens)
             
-            # 결과 정리
-            results = {}
-            for q in questions_dict:
-                results[q] = deepcopy(questions_dict[q])
-                results[q]['tested answer'] = parsed_predicted_answers[q]['answer'] if q in parsed_predicted_answers else "Error: No answer"
-                results[q]['correct'] = q in accepted_questions
-                
-            return batch_id, results, True  # 성공
+            # 배치에 속한 질문의 답변만 반환
+            answers = {q: parsed_predicted_answers[q] for q in q_names if q in parsed_predicted_answers}
+            profile_pickle(answers)
+            return batch_id, answers, True  # 성공
             
         except Exception as e:
             error_msg = str(e)
@@ -310,43 +378,265 @@ def process_single_question_batch(question_batch_data):
             
     return batch_id, {}, False  # 실패
 
-def check_questions_parallel(all_questions, model, n_questions=5, max_attempts=5, n_processes=None):
-    """멀티프로세스로 질문들을 병렬 처리"""
+def make_batch_task(batch_id, records, model, max_attempts, n_samples, max_tokens=DEFAULT_MAX_TOKENS):
+    """워커에 보낼 배치 작업 (질문 키, prompt 문자열만 포함)"""
+    with profile_stage("prompt"):
+        user_prompt = build_user_prompt({record.name: record.prompt_view() for record in records})
+        task = (batch_id, tuple(record.name for record in records), user_prompt, model, max_attempts, n_samples, max_tokens)
+    profile_pickle(task)
+    return task
+
+def profile_pickle(obj):
+    """프로파일링 중이면 Pool이 주고받는 객체의 pickle 비용과 크기를 측정"""
+    if profiling_enabled():
+        with profile_stage("pickle"):
+            add_count("pickle", "bytes", len(pickle.dumps(obj)))
+
+def grade_batch(records, parsed_predicted_answers, n_samples=1):
+    """배치의 파싱된 답변을 채점해 ResultRecord 리스트로 반환"""
+    results = []
+    with profile_stage("grader"):
+        for record in records:
+            predicted = parsed_predicted_answers.get(record.name)
+            extra = None
+            # self-consistency 모드: 투표 분포와 일치율 기록
+            if n_samples > 1:
+                extra = {
+                    'votes': predicted['votes'] if predicted else {},
+                    'samples': predicted['samples'] if predicted else 0,
+                    'agreement': predicted['agreement'] if predicted else 0.0
+                }
+            results.append(ResultRecord(
+                record,
+                predicted['answer'] if predicted else "Error: No answer",
+                is_accepted(record.grading_view(), predicted),
+                extra
+            ))
+    return results
+
+def chunk_records(questions, n_questions):
+    """질문들을 n_questions개씩 배치로 나눔 (resume/샤드처럼 질문 번호가 연속적이지 않은 경우도 있으므로 실제 키 기준)"""
+    records = as_question_records(questions)
+    return [records[start_id:start_id + n_questions] for start_id in range(0, len(records), n_questions)]
+
+def run_batch_tasks(tasks, n_processes=None, lpt=None, features=None):
+    """배치 작업을 Pool에서 실행하며 (batch_id, 답변, 성공 여부)를 완료 순서대로 yield
+
+    lpt(scheduling.LPTScheduler)와 배치별 features를 넘기면 예측 비용이 큰 배치부터
+    제출하고, 아니면 tasks 순서대로 하나씩(chunksize=1) 워커에 배분합니다.
+    """
     if n_processes is None:
         n_processes = min(cpu_count(), 4)  # CPU 코어 수와 4 중 작은 값 사용
     
     print(f"Using {n_processes} processes for parallel evaluation")
     
-    # 배치 생성
-    batches = []
-    shuffled_idx = list(range(len(all_questions)))
-    
-    for start_id in range(0, len(all_questions), n_questions):
-        end_id = min(start_id + n_questions, len(all_questions))
-        
-        batch_questions = {}
-        for k in range(start_id, end_id):
-            q_name = f"question {shuffled_idx[k]}"
-            if q_name in all_questions:
-                batch_questions[q_name] = all_questions[q_name]
+    with profile_stage("runner"), Pool(processes=n_processes) as pool:
+        if lpt is not None:
+            for _, batch_result in lpt.run(pool, process_single_question_batch, tasks, features):
+                yield batch_result
+        else:
+            yield from pool.imap_unordered(process_single_question_batch, tasks, chunksize=1)
         
-        if batch_questions:  # 빈 배치가 아닌 경우만 추가
-            batch_id = start_id // n_questions
-            batches.append((batch_id, batch_questions, model, max_attempts))
+        # terminate 대신 정상 종료시켜 워커의 종료 처리(프로파일 보고서 기록 등)가 실행되도록 함
+        pool.close()
+        pool.join()
+
+def iter_question_results(questions, model, n_questions=5, max_attempts=5, n_processes=None, n_samples=1, scheduler="lpt", max_tokens=DEFAULT_MAX_TOKENS):
+    """멀티프로세스로 질문들을 병렬 처리하며 완료되는 순서대로 ResultRecord를 yield
+
+    questions는 질문 dict 또는 QuestionRecord 목록입니다. 실패한 배치의 질문은
+    결과에 포함되지 않습니다. scheduler가 "lpt"면 예측 비용이 큰 배치부터 제출하고
+    (scheduling.LPTScheduler), "fifo"면 인덱스 순서대로 제출합니다.
+    """
+    if scheduler not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler: {scheduler!r} (expected one of {', '.join(SCHEDULERS)})")
+    if n_processes is None:
+        n_processes = min(cpu_count(), 4)  # CPU 코어 수와 4 중 작은 값 사용
+    if n_samples > 1:
+        print(f"Self-consistency mode: {n_samples} samples per request")
     
-    # 멀티프로세스 실행
-    all_results = {}
+    chunks = chunk_records(questions, n_questions)
+    
+    if scheduler == "lpt":
+        lpt = LPTScheduler(n_processes)
+        tasks = [make_batch_task(batch_id, chunk, model, max_attempts, n_samples, max_tokens) for batch_id, chunk in enumerate(chunks)]
+        batch_results = run_batch_tasks(tasks, n_processes, lpt, [batch_features(chunk) for chunk in chunks])
+    else:
+        tasks = (make_batch_task(batch_id, chunk, model, max_attempts, n_samples, max_tokens) for batch_id, chunk in enumerate(chunks))
+        batch_results = run_batch_tasks(tasks, n_processes)
+    
+    successful_batches = 0
+    
+    for batch_id, answers, success in batch_results:
+        if success:
+            yield from grade_batch(chunks[batch_id], answers, n_samples)
+            successful_batches += 1
+        else:
+            print(f"Batch {batch_id} failed after all attempts")
+        chunks[batch_id] = None  # 처리된 배치는 참조 해제
+    
+    print(f"Completed {successful_batches}/{len(chunks)} batches successfully")
+    
+    if scheduler == "lpt" and chunks:
+        report = lpt.report()
+        print(f"Makespan: actual {report['actual']:.2f}s, predicted {report['predicted_lpt']:.2f}s (LPT) "
+              f"vs {report['predicted_in_order']:.2f}s (index order)")
+
+def check_questions_parallel(all_questions, model, n_questions=5, max_attempts=5, n_processes=None, n_samples=1, scheduler="lpt", max_tokens=DEFAULT_MAX_TOKENS):
+    """멀티프로세스로 질문들을 병렬 처리 (n_samples > 1 이면 self-consistency 투표)"""
+    results = {}
+    for result in iter_question_results(all_questions, model, n_questions, max_attempts, n_processes, n_samples, scheduler, max_tokens):
+        results[result.name] = result.to_dict()
+    return results
+
+# 옵션 순서 순열 평가 (position bias 측정)
+OPTION_ID_PATTERN = re.compile(r'option\s*(\d+)', re.IGNORECASE)
+MAX_ENUMERATED_ORDERS = 720  # 옵션 6개(6!)까지는 모든 순서를 나열해 비복원 추출
+
+def n_option_orders(record, n_permutations):
+    """질문에서 실제로 평가할 서로 다른 옵션 순서 수 (옵션 수의 계승이 상한)"""
+    return min(n_permutations, math.factorial(len(record.options)))
+
+def option_orders(record, n_orders, seed=0):
+    """질문의 서로 다른 옵션 순서 n_orders개 (첫 번째는 원래 순서)
+
+    원래 순서를 제외한 순서들을 질문별 시드로 섞어 앞에서부터 사용하므로 같은 순서가
+    반복되지 않고, n_orders가 달라도 앞부분의 순서는 같습니다.
+    """
+    identity = tuple(range(1, len(record.options) + 1))
+    if n_orders > math.factorial(len(identity)):
+        raise ValueError(f"{record.name} has only {math.factorial(len(identity))} distinct option orders")
+    # 문자열 시드는 실행/프로세스와 무관하게 같은 순열을 만듦
+    rng = random.Random(f"{seed}:{record.name}")
+    if math.factorial(len(identity)) <= MAX_ENUMERATED_ORDERS:
+        others = list(itertools.permutations(identity))[1:]  # 첫 번째가 원래 순서
+        rng.shuffle(others)
+        return [identity] + others[:n_orders - 1]
+    
+    orders = [identity]
+    seen = {identity}
+    while len(orders) < n_orders:
+        order = list(identity)
+        rng.shuffle(order)
+        order = tuple(order)
+        if order not in seen:
+            seen.add(order)
+            orders.append(order)
+    return orders
+
+def permute_question_options(record, perm_idx, seed=0):
+    """질문의 옵션 순서를 결정적으로 섞은 QuestionRecord와 위치 매핑을 반환
+
+    perm_idx 0은 항상 원래 순서이고, 같은 질문의 perm_idx들은 서로 다른 순서입니다.
+    반환되는 canonical_ids[j]는 섞인 질문의 'option {j+1}'이 원래 데이터셋에서 몇 번
+    옵션이었는지를 나타냅니다.
+    """
+    canonical_ids = list(option_orders(record, perm_idx + 1, seed)[perm_idx])
+    
+    options = tuple(record.options[old_id - 1] for old_id in canonical_ids)
+    
+    # 정답도 섞인 위치로 다시 작성
+    answer = record.answer
+    answer_match = OPTION_ID_PATTERN.match(record.answer)
+    if answer_match and int(answer_match.group(1)) in canonical_ids:
+        correct_old_id = int(answer_match.group(1))
+        correct_new_id = canonical_ids.index(correct_old_id) + 1
+        answer = f"option {correct_new_id}: {record.options[correct_old_id - 1]}"
+    
+    permuted = QuestionRecord(record.name, record.question, options, answer,
+                              record.explanation, record.category, record.extra_fields)
+    return permuted, canonical_ids
+
+def to_canonical_answer(tested_answer, canonical_ids, record):
+    """섞인 순서 기준의 모델 답변을 원래 옵션 ID 기준 답변으로 변환 (해석 불가 시 None)"""
+    answer_match = OPTION_ID_PATTERN.match(tested_answer)
+    if not answer_match:
+        return None
+    new_id = int(answer_match.group(1))
+    if not 1 <= new_id <= len(canonical_ids):
+        return None
+    old_id = canonical_ids[new_id - 1]
+    return f"option {old_id}: {record.options[old_id - 1]}"
+
+def iter_permuted_results(questions, model, n_permutations=4, seed=0, n_questions=5, max_attempts=5, n_processes=None, n_samples=1, max_tokens=DEFAULT_MAX_TOKENS):
+    """질문마다 n_permutations개의 옵션 순서로 평가하고 원래 옵션 기준으로 합친 ResultRecord를 yield
+
+    옵션이 적어 서로 다른 순서가 n_permutations개보다 적은 질문은 가능한 순서만 평가합니다.
+    같은 배치의 순열들은 연달아 제출되어 동시에 서버에 도착하므로 (공통 system prompt와
+    질문 본문을 공유) vLLM prefix caching의 이득을 봅니다. 모든 순열이 성공한 질문만
+    결과에 포함되어 resume 시 나머지가 다시 평가됩니다.
+    """
+    print(f"Permutation mode: {n_permutations} option orders per question (seed {seed})")
+    
+    chunks = chunk_records(questions, n_questions)
+    
+    def permuted_chunk(chunk_id, perm_idx):
+        # 순열은 결정적이므로 저장하지 않고 제출/채점 시점에 다시 계산
+        return [(record, *permute_question_options(record, perm_idx, seed)) for record in chunks[chunk_id]
+                if perm_idx < n_option_orders(record, n_permutations)]
+    
+    # 배치 생성: 같은 질문 묶음의 순열들을 인접하게 배치 (가능한 순서가 없는 질문만 남은 배치는 생략)
+    submitted_batches = 0
+    
+    def iter_tasks():
+        nonlocal submitted_batches
+        for chunk_id in range(len(chunks)):
+            for perm_idx in range(n_permutations):
+                permuted = [permuted for _, permuted, _ in permuted_chunk(chunk_id, perm_idx)]
+                if not permuted:
+                    break
+                submitted_batches += 1
+                yield make_batch_task((chunk_id, perm_idx), permuted, model, max_attempts, n_samples, max_tokens)
+    
+    # 질문별로 순열 결과를 모았다가 모두 모이면 내보냄
+    pending = {}
     successful_batches = 0
     
-    with Pool(processes=n_processes) as pool:
-        batch_results = pool.map(process_single_question_batch, batches)
+    # 멀티프로세스 실행 (chunksize=1: 인접한 순열들이 서로 다른 워커에 동시에 배분됨)
+    for (chunk_id, perm_idx), answers, success in run_batch_tasks(iter_tasks(), n_processes):
+        if not success:
+            print(f"Batch {chunk_id} permutation {perm_idx} failed after all attempts")
+            continue
+        successful_batches += 1
         
-        for batch_id, results, success in batch_results:
-            if success:
-                all_results.update(results)
-                successful_batches += 1
-            else:
-                print(f"Batch {batch_id} failed after all attempts")
+        completed = []
+        with profile_stage("grader"):
+            for record, permuted, canonical_ids in permuted_chunk(chunk_id, perm_idx):
+                predicted = answers.get(record.name)
+                tested_answer = predicted['answer'] if predicted else "Error: No answer"
+                per_question = pending.setdefault(record.name, [None] * n_option_orders(record, n_permutations))
+                per_question[perm_idx] = (
+                    tested_answer,
+                    to_canonical_answer(tested_answer, canonical_ids, record),
+                    is_accepted(permuted.grading_view(), predicted)
+                )
+                if all(entry is not None for entry in per_question):
+                    del pending[record.name]
+                    completed.append(merge_permutation_results(record, per_question))
+        yield from completed
     
-    print(f"Completed {successful_batches}/{len(batches)} batches successfully")
-    return all_results
+    print(f"Completed {successful_batches}/{submitted_batches} batches successfully")
+
+def merge_permutation_results(record, per_question):
+    """질문 하나의 순열별 (답변, 원래 옵션 기준 답변, 정답 여부)를 ResultRecord로 합침"""
+    n_permutations = len(per_question)
+    canonical_answers = [canonical for _, canonical, _ in per_question]
+    permutation_correct = [correct for _, _, correct in per_question]
+    
+    answered = [answer for answer in canonical_answers if answer is not None]
+    modal_count = Counter(answered).most_common(1)[0][1] if answered else 0
+    
+    # 'tested answer'/'correct'는 원래 순서(순열 0) 기준이라 일반 실행 결과와 비교 가능
+    return ResultRecord(record, per_question[0][0], permutation_correct[0], {
+        'permutation answers': canonical_answers,
+        'permutation correct': permutation_correct,
+        'permutation accuracy': sum(permutation_correct) / n_permutations,
+        'consistency': modal_count / n_permutations
+    })
+
+def check_questions_permuted(all_questions, model, n_permutations=4, seed=0, n_questions=5, max_attempts=5, n_processes=None, n_samples=1, max_tokens=DEFAULT_MAX_TOKENS):
+    """옵션 순서 순열 평가 결과를 {질문 키: 결과 dict}로 반환"""
+    results = {}
+    for result in iter_permuted_results(all_questions, model, n_permutations, seed, n_questions, max_attempts, n_processes, n_samples, max_tokens):
+        results[result.name] = result.to_dict()
+    return results
@@ -0,0 +1,298 @@
+"""
+클라이언트 측 프로파일링 (opt-in)
+
+TELEQNA_PROFILE=<출력 디렉터리> 환경 변수(또는 run.py --profile)로 켜면 평가
+경로의 단계(stage)별로 wall/CPU 시간과 cProfile 통계를 프로세스마다 수집해 종료 시
+보고서로 씁니다. 꺼져 있으면 profile_stage()는 아무 일도 하지 않는 context manager를
+반환합니다.
+
+단계는 중첩될 수 있으며 바깥 단계는 안쪽 단계가 실행되는 동안 멈추므로 각 단계의
+시간은 자기 자신만의(exclusive) 시간입니다. wall 시간과 CPU 시간의 차이가 서버 응답
+대기 등 클라이언트가 CPU를 쓰지 않은 시간입니다.
+
+측정은 profiler를 만든 스레드(메인 스레드)에서 실행된 단계만 대상으로 합니다.
+TELEQNA_PROFILE_SAMPLE=N 이면 단계마다 N번 호출 중 한 번만 cProfile 측정을 합니다
+(시간 측정은 매번).
+
+TELEQNA_PROFILE_MEMORY=1 이면 tracemalloc으로 메모리 변화도 측정합니다. tracemalloc은
+모든 할당을 느리게 만들므로 샘플링된 단계가 실행되는 동안에만 켜고 단계가 끝나면
+끕니다. 따라서 샘플링되지 않은 호출의 시간은 tracemalloc의 영향을 받지 않습니다.
+메모리 피크는 중첩 단계에서 근사값입니다.
+
+보고서 (출력 디렉터리):
+    <role>-<pid>-<stage>.txt / .prof   단계별 cProfile 통계 (tottime, cumulative 상위 함수)
+    <role>-<pid>-allocations.txt       측정 구간이 끝날 때 남아 있던 상위 할당 위치 (메모리 측정 시)
+    <role>-<pid>-summary.json          단계별 수치
+    stages.txt                         메인 프로세스가 모든 프로세스의 요약을 합친 표
+"""
+
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+PROFILE_ENV = "TELEQNA_PROFILE"
+SAMPLE_ENV = "TELEQNA_PROFILE_SAMPLE"
+MEMORY_ENV = "TELEQNA_PROFILE_MEMORY"
+TOP_FUNCTIONS = 25
+
+_NULL_STAGE = nullcontext()
+_profiler = None
+_disabled_pid = None
+
+
+class _StageStats:
+    __slots__ = ("calls", "profiled_calls", "wall", "cpu", "alloc", "peak", "profile", "counters")
+
+    def __init__(self):
+        self.calls = 0
+        self.profiled_calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.alloc = 0
+        self.peak = 0
+        self.profile = None
+        self.counters = {}
+
+    def summary(self):
+        return {
+            "calls": self.calls,
+            "profiled_calls": self.profiled_calls,
+            "wall": self.wall,
+            "cpu": self.cpu,
+            "alloc_bytes": self.alloc,
+            "peak_bytes": self.peak,
+            "counters": self.counters
+        }
+
+
+class _Stage:
+    """단계 하나의 실행 구간 (바깥 단계를 멈추고 자신을 측정)"""
+
+    __slots__ = ("profiler", "stats", "sampled", "traced", "wall_start", "cpu_start", "mem_start")
+
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.stats = profiler.stage_stats(name)
+
+    def _resume(self):
+        self.wall_start = time.perf_counter()
+        self.cpu_start = time.process_time()
+        if self.sampled:
+            self.stats.profile.enable()
+
+    def _pause(self):
+        if self.sampled:
+            self.stats.profile.disable()
+        self.stats.wall += time.perf_counter() - self.wall_start
+        self.stats.cpu += time.process_time() - self.cpu_start
+
+    def __enter__(self):
+        stats = self.stats
+        stats.calls += 1
+        self.sampled = (stats.calls - 1) % self.profiler.sample_every == 0
+        self.traced = self.sampled and self.profiler.trace_memory
+        stack = self.profiler.stack
+        if stack:
+            stack[-1]._pause()
+        stack.append(self)
+        if self.sampled:
+            stats.profiled_calls += 1
+            if stats.profile is None:
+                stats.profile = self.profiler.cProfile.Profile()
+        if self.traced:
+            self.mem_start = self.profiler.start_tracing()
+        self._resume()
+        return self
+
+    def __exit__(self, *exc_info):
+        stack = self.profiler.stack
+        # generator 안의 단계는 순서가 어긋난 채 닫힐 수 있음: 맨 위가 아니면 이미 멈춘 상태
+        was_top = stack[-1] is self
+        if was_top:
+            self._pause()
+        stats = self.stats
+        if self.traced:
+            current, peak = self.profiler.tracemalloc.get_traced_memory()
+            stats.alloc += current - self.mem_start
+            stats.peak = max(stats.peak, peak - self.mem_start)
+            self.profiler.stop_tracing()
+        stack.remove(self)
+        if was_top and stack:
+            stack[-1]._resume()
+        return False
+
+
+class _ProcessProfiler:
+    """프로세스 하나의 단계별 측정값과 보고서 작성"""
+
+    def __init__(self, output_dir, sample_every, trace_memory=False):
+        # 프로파일링을 켰을 때만 필요한 모듈은 여기서 import (꺼져 있을 때의 시작 시간 단축)
+        import atexit
+        import cProfile
+        import multiprocessing
+        from multiprocessing import util
+        
+        self.cProfile = cProfile
+        self.tracemalloc = None
+        if trace_memory:
+            import tracemalloc
+            self.tracemalloc = tracemalloc
+        self.trace_memory = trace_memory
+        self.traced_depth = 0  # 현재 열려 있는 메모리 측정 단계 수
+        self.started_tracing = False  # tracemalloc을 이 profiler가 켰는지 (외부에서 켠 경우 끄지 않음)
+        self.allocation_sites = {}
+        self.output_dir = output_dir
+        self.sample_every = max(sample_every, 1)
+        self.pid = os.getpid()
+        self.thread_id = threading.get_ident()
+        self.is_main = multiprocessing.parent_process() is None
+        self.role = "main" if self.is_main else "worker"
+        self.stages = {}
+        self.stack = []
+        os.makedirs(output_dir, exist_ok=True)
+        if trace_memory and hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=_stop_inherited_tracing)
+        if self.is_main:
+            atexit.register(self.write_reports)
+        else:
+            # Pool 워커는 atexit 대신 multiprocessing finalizer로 종료 시 기록 (pool.close/join 필요)
+            util.Finalize(self, self.write_reports, exitpriority=10)
+
+    def start_tracing(self):
+        """메모리 측정 구간 시작 (가장 바깥 단계에서 tracemalloc을 켬), 현재 추적 중인 바이트 수 반환"""
+        tracemalloc = self.tracemalloc
+        if self.traced_depth == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.started_tracing = True
+        self.traced_depth += 1
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+    def stop_tracing(self):
+        """메모리 측정 구간 종료 (가장 바깥 단계가 끝나면 남은 할당 위치를 누적하고 tracemalloc을 끔)"""
+        tracemalloc = self.tracemalloc
+        self.traced_depth -= 1
+        if self.traced_depth > 0 or not self.started_tracing:
+            return
+        for stat in tracemalloc.take_snapshot().statistics("lineno")[:TOP_FUNCTIONS]:
+            site = str(stat.traceback)
+            size, count = self.allocation_sites.get(site, (0, 0))
+            self.allocation_sites[site] = (size + stat.size, count + stat.count)
+        tracemalloc.stop()
+        self.started_tracing = False
+
+    def stage_stats(self, name):
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = _StageStats()
+        return stats
+
+    def _report_path(self, suffix):
+        return os.path.join(self.output_dir, f"{self.role}-{self.pid}-{suffix}")
+
+    def write_reports(self):
+        import pstats
+        
+        if os.getpid() != self.pid or not self.stages:
+            return
+        for name, stats in self.stages.items():
+            if stats.profile is None:
+                continue
+            stats.profile.dump_stats(self._report_path(f"{name}.prof"))
+            with open(self._report_path(f"{name}.txt"), "w", encoding="utf-8") as f:
+                f.write(f"Stage '{name}': {stats.calls} calls ({stats.profiled_calls} profiled), "
+                        f"wall {stats.wall:.3f}s, cpu {stats.cpu:.3f}s\n\n")
+                for sort_key in ("tottime", "cumulative"):
+                    f.write(f"--- sorted by {sort_key} ---\n")
+                    pstats.Stats(stats.profile, stream=f).sort_stats(sort_key).print_stats(TOP_FUNCTIONS)
+
+        if self.allocation_sites:
+            top_sites = sorted(self.allocation_sites.items(), key=lambda item: item[1][0], reverse=True)
+            with open(self._report_path("allocations.txt"), "w", encoding="utf-8") as f:
+                for site, (size, count) in top_sites[:TOP_FUNCTIONS]:
+                    f.write(f"{site}: size={size / 1024:.1f} KiB, count={count}\n")
+
+        summary = {"role": self.role, "pid": self.pid,
+                   "stages": {name: stats.summary() for name, stats in self.stages.items()}}
+        with open(self._report_path("summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+
+        if self.is_main:
+            write_stage_table(self.output_dir)
+
+
+def write_stage_table(output_dir):
+    """모든 프로세스의 summary.json을 역할/단계별로 합쳐 stages.txt로 작성"""
+    totals = {}
+    for file_name in sorted(os.listdir(output_dir)):
+        if not file_name.endswith("-summary.json"):
+            continue
+        with open(os.path.join(output_dir, file_name), encoding="utf-8") as f:
+            summary = json.load(f)
+        for name, stage in summary["stages"].items():
+            total = totals.setdefault((summary["role"], name), {"processes": 0, "calls": 0, "wall": 0.0, "cpu": 0.0,
+                                                                 "alloc_bytes": 0, "peak_bytes": 0, "counters": {}})
+            total["processes"] += 1
+            for key in ("calls", "wall", "cpu", "alloc_bytes"):
+                total[key] += stage[key]
+            total["peak_bytes"] = max(total["peak_bytes"], stage["peak_bytes"])
+            for key, value in stage["counters"].items():
+                total["counters"][key] = total["counters"].get(key, 0) + value
+
+    with open(os.path.join(output_dir, "stages.txt"), "w", encoding="utf-8") as f:
+        f.write(f"{'role':<7} {'stage':<10} {'procs':>5} {'calls':>7} {'wall s':>9} {'cpu s':>9} {'cpu %':>6} "
+                f"{'net alloc KiB':>13} {'peak KiB':>9}  counters\n")
+        for (role, name), total in sorted(totals.items()):
+            cpu_share = total["cpu"] / total["wall"] if total["wall"] > 0 else 0.0
+            counters = ", ".join(f"{key}={value}" for key, value in total["counters"].items())
+            f.write(f"{role:<7} {name:<10} {total['processes']:>5} {total['calls']:>7} {total['wall']:>9.3f} "
+                    f"{total['cpu']:>9.3f} {cpu_share:>6.1%} {total['alloc_bytes'] / 1024:>13.1f} "
+                    f"{total['peak_bytes'] / 1024:>9.1f}  {counters}\n")
+
+
+def _stop_inherited_tracing():
+    """fork된 자식은 부모의 측정 구간(예: runner 단계) 중인 tracemalloc을 물려받으므로 끔"""
+    if _profiler is not None and _profiler.started_tracing:
+        _profiler.tracemalloc.stop()
+
+
+def _get_profiler():
+    global _profiler, _disabled_pid
+    pid = os.getpid()
+    if _profiler is not None and _profiler.pid == pid:
+        return _profiler
+    if _disabled_pid == pid:
+        return None
+
+    output_dir = os.getenv(PROFILE_ENV)
+    if not output_dir:
+        _disabled_pid = pid
+        return None
+
+    # fork된 워커는 부모의 profiler를 물려받지 않고 pid별로 새로 만듦
+    _profiler = _ProcessProfiler(output_dir, int(os.getenv(SAMPLE_ENV, "1")),
+                                 os.getenv(MEMORY_ENV, "0") not in ("", "0"))
+    return _profiler
+
+
+def enabled():
+    return _get_profiler() is not None
+
+
+def profile_stage(name):
+    """name 단계를 측정하는 context manager (프로파일링이 꺼져 있으면 no-op)"""
+    profiler = _get_profiler()
+    # Pool의 task handler 스레드 등에서 호출된 경우는 측정하지 않음 (단계 스택은 스레드 하나 기준)
+    if profiler is None or threading.get_ident() != profiler.thread_id:
+        return _NULL_STAGE
+    return _Stage(profiler, name)
+
+
+def add_count(name, key, value=1):
+    """단계에 임의의 카운터(예: pickle 바이트 수)를 누적"""
+    profiler = _get_profiler()
+    if profiler is not None:
+        counters = profiler.stage_stats(name).counters
+        counters[key] = counters.get(key, 0) + value
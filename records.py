@@ -0,0 +1,248 @@
+"""
+질문/결과의 compact 표현과 결과 스트리밍
+
+QuestionRecord는 __slots__ 기반으로 질문 하나를 담고, 모델에 보낼 프롬프트 뷰와
+채점용 뷰를 따로 제공합니다. ResultRecord는 원본 질문을 복사하지 않고 참조만
+들고 있다가 저장 시점에만 dict로 펼칩니다.
+"""
+
+import glob
+import json
+import os
+import re
+import uuid
+
+OPTION_KEY_PATTERN = re.compile(r'option (\d+)')
+TMP_SUFFIX_PATTERN = re.compile(r'\.[0-9a-f]{32}\.tmp')
+READ_CHUNK_SIZE = 1 << 20
+KNOWN_FIELDS = ("question", "answer", "explanation", "category")
+
+
+class QuestionRecord:
+    """데이터셋 질문 하나 (옵션은 'option 1'부터 순서대로 tuple로 저장)"""
+
+    __slots__ = ("name", "question", "options", "answer", "explanation", "category", "extra_fields")
+
+    def __init__(self, name, question, options, answer, explanation=None, category=None, extra_fields=None):
+        self.name = name
+        self.question = question
+        self.options = options
+        self.answer = answer
+        self.explanation = explanation
+        self.category = category
+        self.extra_fields = extra_fields
+
+    @classmethod
+    def from_dict(cls, name, data):
+        options = {}
+        extra_fields = None
+        for key, value in data.items():
+            option_match = OPTION_KEY_PATTERN.fullmatch(key)
+            if option_match:
+                options[int(option_match.group(1))] = value
+            elif key not in KNOWN_FIELDS:
+                if extra_fields is None:
+                    extra_fields = {}
+                extra_fields[key] = value
+        return cls(
+            name,
+            data["question"],
+            tuple(options[option_id] for option_id in sorted(options)),
+            data["answer"],
+            data.get("explanation"),
+            data.get("category"),
+            extra_fields
+        )
+
+    def option_items(self):
+        """('option 1', text), ('option 2', text), ..."""
+        return ((f"option {option_id}", text) for option_id, text in enumerate(self.options, start=1))
+
+    def prompt_view(self):
+        """모델에 보낼 필드만 담은 dict (정답과 해설 제외)"""
+        view = {"question": self.question}
+        view.update(self.option_items())
+        # 기존 실행과 같은 프롬프트를 유지하기 위해 category는 포함
+        if self.category is not None:
+            view["category"] = self.category
+        return view
+
+    def grading_view(self):
+        """모델 답변과 비교할 기대값"""
+        return {"question": self.question, "answer": self.answer}
+
+    def to_dict(self):
+        """데이터셋 형식의 dict로 복원"""
+        data = {"question": self.question}
+        data.update(self.option_items())
+        data["answer"] = self.answer
+        if self.explanation is not None:
+            data["explanation"] = self.explanation
+        if self.category is not None:
+            data["category"] = self.category
+        if self.extra_fields:
+            data.update(self.extra_fields)
+        return data
+
+
+def as_question_records(questions):
+    """질문 dict({name: 질문 dict}) 또는 QuestionRecord 목록을 QuestionRecord 리스트로 변환"""
+    if isinstance(questions, dict):
+        return [QuestionRecord.from_dict(q_name, q_data) for q_name, q_data in questions.items()]
+    return list(questions)
+
+
+class ResultRecord:
+    """질문 하나의 평가 결과 (extra에는 self-consistency/순열 모드 등의 추가 필드)"""
+
+    __slots__ = ("record", "tested_answer", "correct", "extra")
+
+    def __init__(self, record, tested_answer, correct, extra=None):
+        self.record = record
+        self.tested_answer = tested_answer
+        self.correct = correct
+        self.extra = extra
+
+    @property
+    def name(self):
+        return self.record.name
+
+    def to_dict(self):
+        """결과 파일 형식: 원본 질문 필드 + 'tested answer', 'correct' (+ 추가 필드)"""
+        data = self.record.to_dict()
+        data["tested answer"] = self.tested_answer
+        data["correct"] = self.correct
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+class ResultStreamWriter:
+    """결과를 하나씩 JSON 객체로 기록하는 writer
+
+    결과 전체를 메모리에 모으지 않고 임시 파일(<path>.<uuid>.tmp)에 바로 쓰며, 종료 시
+    (예외나 Ctrl-C로 중단된 경우에도) JSON 객체를 닫고 대상 경로로 rename합니다.
+    SIGKILL/OOM 등으로 프로세스가 바로 죽으면 임시 파일이 남는데, 결과마다 flush하므로
+    마지막으로 쓰던 결과를 제외한 내용은 find_orphaned_results/iter_saved_results로
+    다시 읽어 resume할 수 있습니다. supersedes에 넘긴 파일(이미 옮겨 적은 임시 파일)은
+    rename 후 삭제합니다.
+    """
+
+    def __init__(self, path, supersedes=()):
+        self.path = path
+        self.count = 0
+        self.supersedes = list(supersedes)
+        self._tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self._tmp_path, "w", encoding="utf-8")
+        self._file.write("{")
+
+    def write(self, name, result):
+        separator = ", " if self.count else ""
+        self._file.write(f"{separator}{json.dumps(name)}: {json.dumps(result)}")
+        # 프로세스가 강제 종료되어도 OS에 넘긴 결과는 임시 파일에 남도록 함
+        self._file.flush()
+        self.count += 1
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.write("}")
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+        for superseded_path in self.supersedes:
+            try:
+                os.remove(superseded_path)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def find_orphaned_results(path):
+    """강제 종료된 ResultStreamWriter가 남긴 path의 임시 파일 목록"""
+    prefix_length = len(path)
+    return sorted(tmp_path for tmp_path in glob.glob(f"{glob.escape(path)}.*.tmp")
+                  if TMP_SUFFIX_PATTERN.fullmatch(tmp_path[prefix_length:]))
+
+
+def iter_saved_results(path, allow_truncated=False):
+    """결과 파일({name: result, ...})을 전체를 읽지 않고 항목 하나씩 (name, result)로 yield
+
+    allow_truncated이면 중간에 끊긴 파일(강제 종료로 남은 임시 파일)에서 온전한
+    항목까지만 읽고 멈춥니다.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def read_more():
+            nonlocal buffer, pos, eof
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                eof = True
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        def next_token():
+            """공백을 건너뛴 다음 문자 (끝이면 None)"""
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer):
+                    return buffer[pos]
+                if eof:
+                    return None
+                read_more()
+
+        def decode_value():
+            """다음 JSON 값을 디코딩 (버퍼에서 잘렸으면 더 읽고, 파일이 끊겼으면 None)"""
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # 숫자 등은 버퍼 끝에서 잘린 채 디코딩될 수 있으므로 뒤에 내용이 있을 때만 확정
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        return None
+                read_more()
+
+        def truncated():
+            if not allow_truncated:
+                raise ValueError(f"Truncated results file: {path}")
+
+        if next_token() is None and allow_truncated:
+            return
+        if next_token() != "{":
+            raise ValueError(f"Not a results file: {path}")
+        pos += 1
+        while True:
+            token = next_token()
+            if token == "}":
+                return
+            if token == ",":
+                pos += 1
+                token = next_token()
+            if token is None:
+                return truncated()
+            name = decode_value()
+            if name is None or next_token() != ":":
+                return truncated()
+            pos += 1
+            next_token()
+            result = decode_value()
+            if result is None:
+                return truncated()
+            yield name, result
+            if pos > READ_CHUNK_SIZE:
+                buffer = buffer[pos:]
+                pos = 0
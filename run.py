@@ -1,15 +1,97 @@
-from evaluation_tools import *
 import os 
 import json
-import numpy as np
-import pandas as pd
 import sys
 import time
 
+# 명령행 옵션 (모델 이름보다 앞에 처리)
+#   --profile[=dir]      클라이언트 측 단계별 프로파일링 (TELEQNA_PROFILE 환경 변수와 동일)
+#   --list-models        서버의 모델 목록만 출력하고 종료
+#   --summarize <file>   평가 없이 기존 결과 파일의 통계만 다시 출력
+args = []
+for arg in sys.argv[1:]:
+    if arg == "--profile" or arg.startswith("--profile="):
+        # 워커 프로세스도 상속하도록 환경 변수로 설정
+        os.environ["TELEQNA_PROFILE"] = arg.partition("=")[2] or "profile_reports"
+    else:
+        args.append(arg)
+if os.getenv("TELEQNA_PROFILE"):
+    print(f"Profiling enabled, reports will be written to {os.environ['TELEQNA_PROFILE']}")
+
+from evaluation_tools import *
+from records import QuestionRecord, ResultStreamWriter, find_orphaned_results, iter_saved_results
+from tune import load_tuning_profile, profile_key
+from profiling import profile_stage
+from scheduling import SCHEDULERS
+
+def summary_row(result):
+    """요약 통계에 필요한 값만 추출"""
+    row = {'categories': result['category'], 'correct': result['correct']}
+    if 'agreement' in result:
+        row['agreement'] = result['agreement']
+    if 'permutation correct' in result:
+        row['permutation accuracy'] = result['permutation accuracy']
+        row['consistency'] = result['consistency']
+        row['fully consistent'] = result['consistency'] == 1.0
+        row['always correct'] = all(result['permutation correct'])
+        row['permutations'] = len(result['permutation correct'])
+    return row
+
+def print_summary(summary_rows):
+    """카테고리별 정확도 (및 self-consistency/순열 모드 지표) 출력"""
+    # pandas/numpy는 요약 시점에만 import (빠른 명령의 시작 시간 단축)
+    import numpy as np
+    import pandas as pd
+    
+    # 통계 계산
+    res = pd.DataFrame(summary_rows, columns=['categories', 'correct'])
+    
+    summary = res.groupby('categories').mean()
+    summary['counts'] = res.groupby('categories').count()['correct'].values
+    
+    print("Total number of questions answered: {}".format(len(res)))
+    print(summary)
+    print()
+    print()
+    print("Final result: {}".format(np.mean(res['correct'])))
+    
+    # self-consistency 모드: 평균 일치율 (모델 안정성 지표)
+    agreements = [row['agreement'] for row in summary_rows if 'agreement' in row]
+    if agreements:
+        print("Mean agreement rate: {} ({} questions)".format(np.mean(agreements), len(agreements)))
+    
+    # 순열 모드: 카테고리별 위치 편향/일관성 지표
+    permutation_rows = [row for row in summary_rows if 'permutations' in row]
+    if permutation_rows:
+        perm = pd.DataFrame(permutation_rows, columns=['categories', 'correct', 'permutation accuracy',
+                                                       'consistency', 'fully consistent', 'always correct'])
+        
+        print()
+        print("Permutation consistency (up to {} distinct option orders per question):".format(
+            max(row['permutations'] for row in permutation_rows)))
+        print(perm.groupby('categories').mean().to_string())
+        print()
+        print("Overall permutation accuracy: {}".format(perm['permutation accuracy'].mean()))
+        print("Overall consistency: {}".format(perm['consistency'].mean()))
+
+if args and args[0] == "--list-models":
+    print(f"Using vLLM API endpoint: {API_BASE_URL}")
+    for available_model in get_available_models():
+        print(available_model)
+    sys.exit(0)
+
+if args and args[0] == "--summarize":
+    if len(args) < 2:
+        print("Usage: python run.py --summarize <answers file>")
+        sys.exit(1)
+    print_summary([summary_row(result) for _, result in iter_saved_results(args[1])])
+    sys.exit(0)
+
+print(f"Using vLLM API endpoint: {API_BASE_URL}")
+
 # 명령행 인자 또는 환경 변수로 모델 지정 가능
 specified_model = None
-if len(sys.argv) > 1:
-    specified_model = sys.argv[1]
+if args:
+    specified_model = args[0]
     print(f"Model specified via command line: {specified_model}")
 elif "VLLM_MODEL" in os.environ:
     specified_model = os.environ["VLLM_MODEL"]
@@ -31,82 +113,112 @@ else:
     else:
         print("Error: Could not retrieve models from vLLM server")
         print("Please check if vLLM server is running at the configured endpoint")
-        print("Usage: python run.py [model_name] or set VLLM_MODEL environment variable")
+        print("Usage: python run.py [--profile[=dir]] [model_name] or set VLLM_MODEL environment variable")
+        print("       python run.py --list-models | --summarize <answers file>")
         exit(1)
 questions_path = "TeleQnA.txt"
-save_path = os.path.join(model+"_answers.txt")
+n_permutations = int(os.getenv("VLLM_PERMUTATIONS", "0"))  # 2 이상이면 옵션 순서 순열 평가
+permutation_seed = int(os.getenv("VLLM_PERMUTATION_SEED", "0"))
+# tune.py로 저장한 모델/엔드포인트별 프로필이 있으면 기본값으로 사용 (환경 변수가 우선)
+tuning_profile = load_tuning_profile(model, API_BASE_URL) or {}
+if tuning_profile:
+    print("Loaded tuning profile for {} (n_questions={}, n_processes={}, max_tokens={})".format(
+        profile_key(model, API_BASE_URL), tuning_profile["n_questions"], tuning_profile["n_processes"], tuning_profile["max_tokens"]))
 
-n_questions = 5 # Batch the questions asked to reduce time
+n_questions = int(os.getenv("VLLM_N_QUESTIONS", tuning_profile.get("n_questions", 5))) # Batch the questions asked to reduce time
 max_attempts = 5 # Maximal number of trials before skipping the question
-n_processes = int(os.getenv("VLLM_PROCESSES", "4"))  # 환경 변수로 프로세스 수 조정 가능
+n_processes = int(os.getenv("VLLM_PROCESSES", tuning_profile.get("n_processes", 4)))  # 환경 변수로 프로세스 수 조정 가능
+max_tokens = int(os.getenv("VLLM_MAX_TOKENS", tuning_profile.get("max_tokens", DEFAULT_MAX_TOKENS)))
+n_samples = int(os.getenv("VLLM_N_SAMPLES", "1"))  # 1보다 크면 self-consistency 투표 (한 요청에서 n개 샘플)
+scheduler = os.getenv("VLLM_SCHEDULER", "lpt").strip().lower()  # "lpt": 예측 비용이 큰 배치부터 제출, "fifo": 인덱스 순서
+if scheduler not in SCHEDULERS:
+    print("Error: Unknown VLLM_SCHEDULER '{}' (expected one of: {})".format(scheduler, ", ".join(SCHEDULERS)))
+    exit(1)
+
+# 모드별로 결과 파일을 분리해 resume 시 greedy/투표/순열 결과가 섞이지 않도록 함
+save_suffix = ""
+if n_samples > 1:
+    save_suffix += "_sc{}".format(n_samples)
+if n_permutations > 1:
+    save_suffix += "_permutation"
+save_path = os.path.join(model+save_suffix+"_answers.txt")
 
 print("Evaluating {} with {} parallel processes".format(model, n_processes))
 
 with open(questions_path, encoding="utf-8") as f:
     loaded_json = f.read()
 all_questions = json.loads(loaded_json)
+del loaded_json
 
-# 기존 결과가 있다면 로드 (resume 기능)
-if os.path.exists(save_path):
-    with open(save_path) as f:
-        loaded_json = f.read()
-    existing_results = json.loads(loaded_json)
-    
-    # 이미 처리된 질문들을 제외
-    remaining_questions = {}
-    for q_name, q_data in all_questions.items():
-        if q_name not in existing_results:
-            remaining_questions[q_name] = q_data
-    
-    print("Resuming from previous run. {} questions remaining.".format(len(remaining_questions)))
-    all_questions_to_process = remaining_questions
-    existing_count = len(existing_results)
-else:
-    existing_results = {}
-    all_questions_to_process = all_questions
-    existing_count = 0
-    
-if len(all_questions_to_process) == 0:
-    print("All questions already processed!")
-    results = existing_results
-else:
-    print("Processing {} questions with multiprocessing...".format(len(all_questions_to_process)))
-    start_time = time.time()
+# 기존 결과가 있다면 resume: 결과 파일과 강제 종료된 실행이 남긴 임시 파일을 항목 단위로
+# 새 결과 파일에 옮겨 적고, 질문 이름과 요약 통계에 필요한 값만 메모리에 보관
+orphaned_paths = find_orphaned_results(save_path)
+for orphaned_path in orphaned_paths:
+    print("Recovering results from interrupted run: {}".format(orphaned_path))
+
+# 요약 통계에 필요한 값만 질문별로 보관 (결과 전체는 파일로 바로 스트리밍)
+summary_rows = []
+processed_names = set()
+
+with ResultStreamWriter(save_path, supersedes=orphaned_paths) as writer:
+    saved_sources = ([(save_path, False)] if os.path.exists(save_path) else []) + [(p, True) for p in orphaned_paths]
+    for saved_path, allow_truncated in saved_sources:
+        for q_name, result in iter_saved_results(saved_path, allow_truncated):
+            if q_name in processed_names:
+                continue
+            writer.write(q_name, result)
+            summary_rows.append(summary_row(result))
+            processed_names.add(q_name)
     
-    # 멀티프로세스로 병렬 처리
-    new_results = check_questions_parallel(
-        all_questions_to_process, 
-        model, 
-        n_questions=n_questions, 
-        max_attempts=max_attempts,
-        n_processes=n_processes
-    )
+    # 이미 처리된 질문들을 제외하고 compact record로 변환 (원본 dict는 해제)
+    questions_to_process = [QuestionRecord.from_dict(q_name, q_data)
+                            for q_name, q_data in all_questions.items() if q_name not in processed_names]
+    del all_questions
     
-    # 기존 결과와 합치기
-    results = {**existing_results, **new_results}
+    if processed_names:
+        print("Resuming from previous run. {} questions remaining.".format(len(questions_to_process)))
+    processed_names = None
     
-    elapsed_time = time.time() - start_time
-    print(f"Processing completed in {elapsed_time:.2f} seconds")
-
-# 최종 결과 저장
-with open(save_path, 'w') as f:
-    res_str = json.dumps(results)
-    f.write(res_str)
-
-# 통계 계산
-categories = [ques['category'] for ques in results.values()]
-correct = [ques['correct'] for ques in results.values()]
-
-res = pd.DataFrame.from_dict({
-    'categories': categories,
-    'correct': correct
-})
-
-summary = res.groupby('categories').mean()
-summary['counts'] = res.groupby('categories').count()['correct'].values
-
-print("Total number of questions answered: {}".format(len(categories)))
-print(summary)
-print()
-print()
-print("Final result: {}".format(np.mean([q['correct'] for q in results.values()])))
\ No newline at end of file
+    if len(questions_to_process) == 0:
+        print("All questions already processed!")
+    else:
+        print("Processing {} questions with multiprocessing...".format(len(questions_to_process)))
+        start_time = time.time()
+        
+        # 멀티프로세스로 병렬 처리
+        if n_permutations > 1:
+            new_results = iter_permuted_results(
+                questions_to_process,
+                model,
+                n_permutations=n_permutations,
+                seed=permutation_seed,
+                n_questions=n_questions,
+                max_attempts=max_attempts,
+                n_processes=n_processes,
+                n_samples=n_samples,
+                max_tokens=max_tokens
+            )
+        else:
+            new_results = iter_question_results(
+                questions_to_process, 
+                model, 
+                n_questions=n_questions, 
+                max_attempts=max_attempts,
+                n_processes=n_processes,
+                n_samples=n_samples,
+                scheduler=scheduler,
+                max_tokens=max_tokens
+            )
+        
+        # 완료되는 대로 결과 파일에 기록
+        for result in new_results:
+            with profile_stage("writer"):
+                result_dict = result.to_dict()
+                writer.write(result.name, result_dict)
+                summary_rows.append(summary_row(result_dict))
+        
+        elapsed_time = time.time() - start_time
+        print(f"Processing completed in {elapsed_time:.2f} seconds")
+
+with profile_stage("summary"):
+    print_summary(summary_rows)
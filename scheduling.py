@@ -0,0 +1,141 @@
+"""
+배치 스케줄링 (Longest-Processing-Time-first)
+
+배치를 인덱스 순서대로 제출하면 오래 걸리는 배치(긴 Standards specifications
+질문 등)가 마지막에 시작되어 다른 워커가 노는 동안 혼자 끝나기를 기다리게
+됩니다. 여기서는 배치 비용을 프롬프트 길이 × 카테고리별 처리 속도로 예측하고,
+실행 중 관측한 지연 시간으로 카테고리별 속도를 갱신하면서 예측 비용이 큰 배치부터
+제출합니다.
+"""
+
+import heapq
+import queue
+import time
+
+SCHEDULERS = ("lpt", "fifo")  # "lpt": 예측 비용이 큰 배치부터 제출, "fifo": 인덱스 순서
+
+
+class CategoryLatencyModel:
+    """카테고리별 '프롬프트 1글자당 처리 시간'을 온라인으로 학습하는 비용 모델
+
+    배치 특성(features)은 {category: 프롬프트 글자 수} dict입니다. 관측 전에는 모든
+    카테고리가 같은 속도라고 가정하므로 초기 순서는 프롬프트 길이 순입니다.
+    """
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing  # EWMA 갱신 비율
+        self.rates = {}
+        self.global_rate = None
+        self.observations = 0
+
+    def rate(self, category):
+        if category in self.rates:
+            return self.rates[category]
+        return self.global_rate if self.global_rate is not None else 1.0
+
+    def predict(self, features):
+        return sum(chars * self.rate(category) for category, chars in features.items())
+
+    def observe(self, features, latency):
+        """완료된 배치의 실제 지연 시간으로 속도 갱신 (배치 내 글자 비율만큼 각 카테고리에 반영)"""
+        total_chars = sum(features.values())
+        if total_chars <= 0:
+            return
+        observed_rate = latency / total_chars
+        for category, chars in features.items():
+            if category not in self.rates:
+                self.rates[category] = observed_rate
+            else:
+                weight = self.smoothing * chars / total_chars
+                self.rates[category] += weight * (observed_rate - self.rates[category])
+        if self.global_rate is None:
+            self.global_rate = observed_rate
+        else:
+            self.global_rate += self.smoothing * (observed_rate - self.global_rate)
+        self.observations += 1
+
+
+def batch_features(records):
+    """배치의 {category: 프롬프트 글자 수} (질문과 옵션 텍스트 길이 기준)"""
+    features = {}
+    for record in records:
+        chars = len(record.question) + sum(len(str(option)) for option in record.options)
+        features[record.category] = features.get(record.category, 0) + chars
+    return features
+
+
+def simulate_makespan(costs, n_workers):
+    """주어진 제출 순서로 n_workers개 워커에 greedy 배정했을 때의 makespan"""
+    finish_times = [0.0] * max(n_workers, 1)
+    for cost in costs:
+        heapq.heapreplace(finish_times, finish_times[0] + cost)
+    return max(finish_times)
+
+
+class LPTScheduler:
+    """예측 비용이 큰 배치부터 워커 수만큼만 동시에 제출하는 스케줄러
+
+    완료될 때마다 비용 모델을 갱신하고 rerank_every개 완료마다 대기 배치의 순서를
+    다시 계산합니다. 실행이 끝나면 report()로 예측 makespan과 실제 makespan을
+    비교할 수 있습니다.
+    """
+
+    def __init__(self, n_workers, cost_model=None, rerank_every=None):
+        self.n_workers = n_workers
+        self.cost_model = cost_model if cost_model is not None else CategoryLatencyModel()
+        self.rerank_every = rerank_every if rerank_every is not None else n_workers
+        self.latencies = {}
+        self.actual_makespan = None
+        self._features = []
+
+    def run(self, pool, func, tasks, features):
+        """tasks[i]를 pool에서 func로 실행하며 완료 순서대로 (i, 결과) yield"""
+        self._features = features
+        done_queue = queue.Queue()
+        pending = list(range(len(tasks)))
+        submitted_at = {}
+        completed_since_rerank = 0
+        start_time = time.time()
+
+        def rerank():
+            # 예측 비용 오름차순 정렬 → pop()으로 가장 비싼 배치를 꺼냄
+            pending.sort(key=lambda i: self.cost_model.predict(features[i]))
+
+        def submit():
+            i = pending.pop()
+            submitted_at[i] = time.time()
+            pool.apply_async(func, (tasks[i],),
+                             callback=lambda result, i=i: done_queue.put((i, result, None)),
+                             error_callback=lambda error, i=i: done_queue.put((i, None, error)))
+
+        rerank()
+        while pending and len(submitted_at) < self.n_workers:
+            submit()
+
+        while submitted_at:
+            i, result, error = done_queue.get()
+            if error is not None:
+                raise error
+            self.latencies[i] = time.time() - submitted_at.pop(i)
+            self.cost_model.observe(features[i], self.latencies[i])
+
+            completed_since_rerank += 1
+            if completed_since_rerank >= self.rerank_every:
+                rerank()
+                completed_since_rerank = 0
+            if pending:
+                submit()
+
+            yield i, result
+
+        self.actual_makespan = time.time() - start_time
+
+    def report(self):
+        """학습된 비용 모델 기준의 예측 makespan(LPT/인덱스 순서)과 실제 makespan"""
+        costs = [self.cost_model.predict(f) for f in self._features]
+        return {
+            "predicted_lpt": simulate_makespan(sorted(costs, reverse=True), self.n_workers),
+            "predicted_in_order": simulate_makespan(costs, self.n_workers),
+            "actual": self.actual_makespan,
+            "category_rates": dict(self.cost_model.rates)
+        }
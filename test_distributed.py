@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+분산 평가 작업 큐 테스트
+샤드 점유, 만료된 lease 재배치, 결과 병합, 일부만 답을 받은 샤드 처리 검증
+"""
+
+import json
+import os
+import time
+
+import distributed
+import evaluation_tools
+
+def make_queue(tmp_path, n_questions=6, shard_size=3):
+    questions = {}
+    for i in range(n_questions):
+        questions[f"question {i}"] = {"question": f"Q{i}?", "option 1": "a", "option 2": "b",
+                                      "answer": "option 1: a", "category": "Lexicon"}
+    questions_path = tmp_path / "questions.json"
+    questions_path.write_text(json.dumps(questions), encoding="utf-8")
+    queue_dir = str(tmp_path / "queue")
+    manifest = distributed.init_queue(queue_dir, "fake-model", questions_path=str(questions_path),
+                                      shard_size=shard_size, save_path=str(tmp_path / "answers.txt"))
+    return queue_dir, manifest
+
+def answer(q_names):
+    return {q: {"tested answer": "option 1: a", "correct": True} for q in q_names}
+
+def test_claim_is_exclusive(tmp_path):
+    queue_dir, manifest = make_queue(tmp_path)
+    shard_id = manifest["shards"][0]
+
+    assert distributed.try_claim_shard(queue_dir, shard_id, "worker-a")
+    assert not distributed.try_claim_shard(queue_dir, shard_id, "worker-b")
+    assert distributed.read_lease(queue_dir, shard_id)["worker"] == "worker-a"
+
+def test_stale_lease_is_requeued(tmp_path):
+    queue_dir, manifest = make_queue(tmp_path)
+    stale, fresh = manifest["shards"]
+    assert distributed.try_claim_shard(queue_dir, stale, "dead-worker")
+    assert distributed.try_claim_shard(queue_dir, fresh, "live-worker")
+    lease_path = distributed._lease_path(queue_dir, stale)
+    old = time.time() - 1000
+    os.utime(lease_path, (old, old))
+
+    assert distributed.requeue_expired_leases(queue_dir, lease_ttl=60) == [stale]
+    assert not os.path.exists(lease_path)
+    assert distributed.try_claim_shard(queue_dir, stale, "worker-b")
+    assert distributed.read_lease(queue_dir, fresh)["worker"] == "live-worker"
+
+def test_heartbeat_detects_lost_lease(tmp_path):
+    queue_dir, manifest = make_queue(tmp_path)
+    shard_id = manifest["shards"][0]
+    assert distributed.try_claim_shard(queue_dir, shard_id, "worker-a")
+
+    with distributed.LeaseHeartbeat(queue_dir, shard_id, "worker-a", interval=60) as heartbeat:
+        # 만료 처리 후 다른 워커가 점유
+        os.remove(distributed._lease_path(queue_dir, shard_id))
+        assert distributed.try_claim_shard(queue_dir, shard_id, "worker-b")
+
+    assert heartbeat.lost
+    heartbeat.release()
+    assert distributed.read_lease(queue_dir, shard_id)["worker"] == "worker-b"
+
+def test_release_keeps_other_workers_lease(tmp_path):
+    queue_dir, manifest = make_queue(tmp_path)
+    shard_id = manifest["shards"][0]
+    assert distributed.try_claim_shard(queue_dir, shard_id, "worker-b")
+
+    distributed.release_lease(queue_dir, shard_id, token="another claim")
+    assert distributed.read_lease(queue_dir, shard_id)["worker"] == "worker-b"
+
+def test_merge_results_includes_done_and_partial(tmp_path):
+    queue_dir, manifest = make_queue(tmp_path)
+    done_shard, partial_shard = manifest["shards"]
+    distributed._write_json_atomic(distributed._done_path(queue_dir, done_shard),
+                                   answer(["question 0", "question 1", "question 2"]))
+    distributed._write_json_atomic(distributed._partial_path(queue_dir, partial_shard), answer(["question 4"]))
+
+    merged = distributed.merge_results(queue_dir)
+
+    assert sorted(merged) == ["question 0", "question 1", "question 2", "question 4"]
+    with open(manifest["save_path"], encoding="utf-8") as f:
+        assert json.load(f) == merged
+
+def test_incomplete_shard_is_not_marked_done(tmp_path, monkeypatch):
+    queue_dir, manifest = make_queue(tmp_path, n_questions=3)
+    shard_id = manifest["shards"][0]
+    calls = []
+
+    def fake_check(questions, model, **kwargs):
+        calls.append(sorted(questions))
+        # 첫 호출은 한 질문만 답하고, 이후로는 답하지 않음 (클러스터 장애)
+        return answer(sorted(questions)[:1]) if len(calls) == 1 else {}
+
+    monkeypatch.setattr(evaluation_tools, "check_questions_parallel", fake_check)
+    processed = distributed.run_worker(queue_dir, "worker-a", max_empty_shards=2)
+
+    assert processed == 0
+    assert not os.path.exists(distributed._done_path(queue_dir, shard_id))
+    assert not os.path.exists(distributed._lease_path(queue_dir, shard_id))
+    assert calls == [["question 0", "question 1", "question 2"],
+                     ["question 1", "question 2"], ["question 1", "question 2"]]
+    with open(distributed._partial_path(queue_dir, shard_id), encoding="utf-8") as f:
+        assert list(json.load(f)) == ["question 0"]
+
+def test_partial_shard_is_completed_later(tmp_path, monkeypatch):
+    queue_dir, manifest = make_queue(tmp_path, n_questions=3)
+    shard_id = manifest["shards"][0]
+    distributed._write_json_atomic(distributed._partial_path(queue_dir, shard_id), answer(["question 0"]))
+
+    monkeypatch.setattr(evaluation_tools, "check_questions_parallel", lambda questions, model, **kwargs: answer(questions))
+
+    assert distributed.run_worker(queue_dir, "worker-a") == 1
+    with open(distributed._done_path(queue_dir, shard_id), encoding="utf-8") as f:
+        assert sorted(json.load(f)) == ["question 0", "question 1", "question 2"]
+    assert not os.path.exists(distributed._partial_path(queue_dir, shard_id))
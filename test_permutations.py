@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+옵션 순서 순열 매핑 테스트
+permute_question_options / to_canonical_answer의 원래 옵션 ↔ 섞인 옵션 변환 검증
+"""
+
+import itertools
+
+import pytest
+
+from records import QuestionRecord
+from evaluation_tools import permute_question_options, to_canonical_answer, option_orders, n_option_orders
+
+def make_record(n_options, correct_id=3, name="question 7"):
+    data = {"question": "Which option is correct?"}
+    for option_id in range(1, n_options + 1):
+        data[f"option {option_id}"] = f"answer text {option_id}"
+    data["answer"] = f"option {correct_id}: answer text {correct_id}"
+    data["category"] = "Lexicon"
+    return QuestionRecord.from_dict(name, data)
+
+def test_permutation_zero_is_identity():
+    record = make_record(5)
+    permuted, canonical_ids = permute_question_options(record, 0, seed=123)
+    
+    assert canonical_ids == [1, 2, 3, 4, 5]
+    assert permuted.options == record.options
+    assert permuted.answer == record.answer
+
+def test_answer_is_remapped_to_permuted_position():
+    record = make_record(4, correct_id=2)
+    for perm_idx in range(1, 6):
+        permuted, canonical_ids = permute_question_options(record, perm_idx, seed=0)
+        new_id = canonical_ids.index(2) + 1
+        
+        assert sorted(canonical_ids) == [1, 2, 3, 4]
+        assert permuted.answer == f"option {new_id}: answer text 2"
+        assert permuted.options[new_id - 1] == "answer text 2"
+
+def test_to_canonical_answer_round_trip():
+    for n_options in (4, 5):
+        record = make_record(n_options)
+        for perm_idx in range(4):
+            permuted, canonical_ids = permute_question_options(record, perm_idx, seed=1)
+            for new_id, text in enumerate(permuted.options, start=1):
+                old_id = canonical_ids[new_id - 1]
+                canonical = to_canonical_answer(f"option {new_id}: {text}", canonical_ids, record)
+                
+                assert canonical == f"option {old_id}: answer text {old_id}"
+
+def test_to_canonical_answer_rejects_invalid_ids():
+    record = make_record(4)
+    _, canonical_ids = permute_question_options(record, 1, seed=0)
+    
+    assert to_canonical_answer("option 0: nothing", canonical_ids, record) is None
+    assert to_canonical_answer("option 5: nothing", canonical_ids, record) is None
+    assert to_canonical_answer("Error: No answer", canonical_ids, record) is None
+
+def test_same_seed_gives_same_order():
+    record = make_record(5)
+    first = [permute_question_options(record, perm_idx, seed=42)[1] for perm_idx in range(1, 4)]
+    second = [permute_question_options(record, perm_idx, seed=42)[1] for perm_idx in range(1, 4)]
+    other_seed = [permute_question_options(record, perm_idx, seed=43)[1] for perm_idx in range(1, 4)]
+    
+    assert first == second
+    assert first != other_seed
+
+def test_orders_are_distinct_and_exclude_identity_after_first():
+    for q_id in range(200):
+        record = make_record(4, name=f"question {q_id}")
+        orders = [tuple(permute_question_options(record, perm_idx, seed=0)[1]) for perm_idx in range(4)]
+        
+        assert orders[0] == (1, 2, 3, 4)
+        assert len(set(orders)) == 4
+
+def test_all_orders_are_used_when_options_are_few():
+    record = make_record(3, correct_id=1)
+    
+    assert n_option_orders(record, 10) == 6
+    orders = option_orders(record, 6, seed=5)
+    assert sorted(orders) == sorted(itertools.permutations((1, 2, 3)))
+    # 순서 수가 달라도 앞부분은 같음
+    assert option_orders(record, 3, seed=5) == orders[:3]
+    with pytest.raises(ValueError):
+        option_orders(record, 7)
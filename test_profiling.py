@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+프로파일링 테스트
+tracemalloc이 opt-in이며 샘플링된 단계가 실행되는 동안에만 켜지는지 검증
+"""
+
+import atexit
+import tracemalloc
+
+import profiling
+
+def make_profiler(tmp_path, monkeypatch, sample_every, trace_memory):
+    # 테스트 종료 후 보고서를 쓰지 않도록 atexit 등록은 생략
+    monkeypatch.setattr(atexit, "register", lambda func: None)
+    return profiling._ProcessProfiler(str(tmp_path), sample_every, trace_memory)
+
+def test_memory_tracing_is_opt_in(tmp_path, monkeypatch):
+    profiler = make_profiler(tmp_path, monkeypatch, 1, trace_memory=False)
+    
+    with profiling._Stage(profiler, "request"):
+        assert not tracemalloc.is_tracing()
+    assert profiler.stage_stats("request").profiled_calls == 1
+
+def test_memory_tracing_only_during_sampled_stages(tmp_path, monkeypatch):
+    profiler = make_profiler(tmp_path, monkeypatch, 2, trace_memory=True)
+    assert not tracemalloc.is_tracing()
+    
+    with profiling._Stage(profiler, "runner"):
+        with profiling._Stage(profiler, "writer"):
+            buffer = [bytes(1024) for _ in range(100)]
+        assert tracemalloc.is_tracing()
+    assert not tracemalloc.is_tracing()
+    
+    # sample_every=2: 두 번째 호출은 측정하지 않음
+    with profiling._Stage(profiler, "runner"):
+        assert not tracemalloc.is_tracing()
+    
+    assert profiler.stage_stats("writer").alloc >= 100 * 1024
+    assert profiler.stage_stats("runner").profiled_calls == 1
+    assert profiler.allocation_sites
+    del buffer
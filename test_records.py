@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+결과 파일 스트리밍 테스트
+ResultStreamWriter로 쓴 파일과 강제 종료로 남은 임시 파일을 iter_saved_results로 다시 읽는지 검증
+"""
+
+import json
+import os
+
+import pytest
+
+import records
+from records import ResultStreamWriter, find_orphaned_results, iter_saved_results
+
+RESULTS = {
+    "question 0": {"question": "Q0?", "tested answer": "option 1: a", "correct": True},
+    "question 1": {"question": "Braces { and \"quotes\" }", "tested answer": "option 2: b", "correct": False},
+    "question 2": {"question": "Q2?", "votes": {"option 1: a": 3}, "agreement": 0.6, "correct": True},
+}
+
+def write_results(path):
+    with ResultStreamWriter(path) as writer:
+        for name, result in RESULTS.items():
+            writer.write(name, result)
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 20])
+def test_round_trip(tmp_path, monkeypatch, chunk_size):
+    monkeypatch.setattr(records, "READ_CHUNK_SIZE", chunk_size)
+    path = str(tmp_path / "answers.txt")
+    write_results(path)
+
+    assert dict(iter_saved_results(path)) == RESULTS
+    assert find_orphaned_results(path) == []
+
+def test_reads_files_written_by_json_dump(tmp_path):
+    path = tmp_path / "answers.txt"
+    path.write_text(json.dumps(RESULTS, indent=4), encoding="utf-8")
+
+    assert dict(iter_saved_results(str(path))) == RESULTS
+
+def test_truncated_temp_file_is_recovered(tmp_path, monkeypatch):
+    monkeypatch.setattr(records, "READ_CHUNK_SIZE", 5)
+    path = str(tmp_path / "answers.txt")
+    # 강제 종료된 writer: 닫히지 않은 임시 파일에 마지막 결과가 쓰다 만 상태로 남음
+    writer = ResultStreamWriter(path)
+    for name, result in RESULTS.items():
+        writer.write(name, result)
+    writer._file.write(', "question 3": {"question": "Q3')
+    writer._file.flush()
+
+    orphaned = find_orphaned_results(path)
+    assert orphaned == [writer._tmp_path]
+    assert dict(iter_saved_results(orphaned[0], allow_truncated=True)) == RESULTS
+    with pytest.raises(ValueError):
+        list(iter_saved_results(orphaned[0]))
+    writer._file.close()
+
+def test_writer_removes_superseded_files(tmp_path):
+    path = str(tmp_path / "answers.txt")
+    orphaned_path = f"{path}.{'0' * 32}.tmp"
+    with open(orphaned_path, "w", encoding="utf-8") as f:
+        f.write('{"question 0": {}')
+
+    with ResultStreamWriter(path, supersedes=[orphaned_path]) as writer:
+        writer.write("question 0", {})
+
+    assert not os.path.exists(orphaned_path)
+    assert find_orphaned_results(path) == []
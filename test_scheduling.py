@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+"""
+배치 스케줄링 테스트
+스케줄러 이름 검증과 makespan 계산 검증
+"""
+
+import pytest
+
+from evaluation_tools import iter_question_results
+from scheduling import simulate_makespan
+
+@pytest.mark.parametrize("scheduler", ["LPT", "fifo ", "round-robin", ""])
+def test_unknown_scheduler_is_rejected(scheduler):
+    with pytest.raises(ValueError, match="Unknown scheduler"):
+        next(iter_question_results([], "fake-model", scheduler=scheduler))
+
+def test_lpt_order_shortens_makespan():
+    costs = [1, 1, 1, 1, 4]
+    
+    assert simulate_makespan(costs, 2) == 6
+    assert simulate_makespan(sorted(costs, reverse=True), 2) == 4
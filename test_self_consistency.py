@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+self-consistency 투표 테스트
+vote_predicted_answers의 다수결/동률 처리/일치율과 request_predicted_answers의 n_samples 경로 검증
+"""
+
+import json
+
+import pytest
+import requests
+
+from evaluation_tools import vote_predicted_answers, request_predicted_answers
+
+def ballot(answer, question="Q?"):
+    return {"question": question, "answer": answer}
+
+def test_majority_answer_wins():
+    samples = [
+        {"question 0": ballot("option 2: b")},
+        {"question 0": ballot("option 1: a")},
+        {"question 0": ballot("option 2: b")},
+    ]
+    voted = vote_predicted_answers(samples)
+
+    assert voted["question 0"]["answer"] == "option 2: b"
+    assert voted["question 0"]["votes"] == {"option 2: b": 2, "option 1: a": 1}
+    assert voted["question 0"]["samples"] == 3
+    assert voted["question 0"]["agreement"] == pytest.approx(2 / 3)
+
+def test_tie_is_broken_by_first_answer():
+    samples = [
+        {"question 0": ballot("option 3: c", question="from first sample")},
+        {"question 0": ballot("option 1: a", question="from second sample")},
+    ]
+    voted = vote_predicted_answers(samples)
+
+    assert voted["question 0"]["answer"] == "option 3: c"
+    assert voted["question 0"]["question"] == "from first sample"
+    assert voted["question 0"]["agreement"] == 0.5
+
+def test_missing_and_failed_samples_count_in_agreement():
+    # 5개 요청 중 2개는 파싱 실패(투표에서 제외), 1개는 question 1에 답하지 않음
+    samples = [
+        {"question 0": ballot("option 1: a"), "question 1": ballot("option 2: b")},
+        {"question 0": ballot("option 1: a"), "question 1": ballot("option 2: b")},
+        {"question 0": ballot("option 1: a")},
+    ]
+    voted = vote_predicted_answers(samples, n_samples=5)
+
+    assert voted["question 0"]["samples"] == 3
+    assert voted["question 0"]["agreement"] == pytest.approx(3 / 5)
+    assert voted["question 1"]["samples"] == 2
+    assert voted["question 1"]["agreement"] == pytest.approx(2 / 5)
+
+class FakeResponse:
+    status_code = 200
+
+    def __init__(self, contents):
+        self._contents = contents
+        self.text = ""
+
+    def json(self):
+        return {"choices": [{"message": {"content": content}} for content in self._contents]}
+
+def fake_post(contents, payloads):
+    def post(url, headers=None, json=None, timeout=None):
+        payloads.append(json)
+        return FakeResponse(contents)
+    return post
+
+def answer_json(answer):
+    return json.dumps({"question 0": {"question": "Q?", "answer": answer}})
+
+def test_request_votes_over_parsed_samples(monkeypatch):
+    payloads = []
+    contents = [answer_json("option 1: a"), "not json at all", answer_json("option 1: a"), answer_json("option 2: b")]
+    monkeypatch.setattr(requests, "post", fake_post(contents, payloads))
+
+    voted = request_predicted_answers("prompt", "fake-model", n_samples=4)
+
+    assert payloads[0]["n"] == 4
+    assert voted["question 0"]["answer"] == "option 1: a"
+    assert voted["question 0"]["samples"] == 3
+    assert voted["question 0"]["agreement"] == 0.5
+
+def test_request_fails_when_all_samples_fail(monkeypatch):
+    monkeypatch.setattr(requests, "post", fake_post(["garbage", "still garbage"], []))
+
+    with pytest.raises(Exception, match="all 2 samples"):
+        request_predicted_answers("prompt", "fake-model", n_samples=2)
+
+def test_single_sample_request_has_no_n(monkeypatch):
+    payloads = []
+    monkeypatch.setattr(requests, "post", fake_post([answer_json("option 1: a")], payloads))
+
+    parsed = request_predicted_answers("prompt", "fake-model")
+
+    assert "n" not in payloads[0]
+    assert parsed["question 0"]["answer"] == "option 1: a"
+    assert "agreement" not in parsed["question 0"]
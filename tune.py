@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+처리량 자동 튜닝 (n_questions × VLLM_PROCESSES × max_tokens)
+
+TeleQnA에서 카테고리별로 같은 수의 질문을 뽑은 작은 slice를 여러 설정으로
+check_questions_parallel과 같은 경로(iter_question_results)로 평가하고,
+questions/sec, 파싱 실패율, 기준 설정 대비 정확도 변화를 측정합니다. 조건을
+만족하는 설정 중 가장 빠른 것을 모델/엔드포인트별 프로필 파일에 저장하며,
+run.py는 다음 실행부터 이 프로필을 자동으로 읽습니다.
+
+사용법:
+    python tune.py <model> [--per-category 20] [--search grid|coordinate]
+                           [--batch-sizes 3,5,10] [--processes 2,4,8] [--max-tokens 1024,2048,4096]
+
+같은 slice를 반복해서 보내므로 서버의 prefix cache가 뒤쪽 설정에 유리하게 작용할 수
+있습니다. 기준 설정을 가장 먼저 평가해 캐시를 미리 채웁니다.
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime
+
+DEFAULT_PROFILE_PATH = "tuning_profiles.json"
+DEFAULT_CONFIG = {"n_questions": 5, "n_processes": 4, "max_tokens": 4096}
+TUNED_PARAMETERS = ("n_questions", "n_processes", "max_tokens")
+
+
+def profile_path():
+    return os.getenv("VLLM_TUNING_PROFILE", DEFAULT_PROFILE_PATH)
+
+
+def profile_key(model, endpoint):
+    return f"{model}@{endpoint}"
+
+
+def load_tuning_profile(model, endpoint, path=None):
+    """저장된 모델/엔드포인트 프로필 반환 (없으면 None)"""
+    path = path or profile_path()
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        profiles = json.load(f)
+    return profiles.get(profile_key(model, endpoint))
+
+
+def save_tuning_profile(model, endpoint, profile, path=None):
+    """다른 모델의 프로필은 유지하고 해당 키만 갱신"""
+    path = path or profile_path()
+    profiles = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            profiles = json.load(f)
+    profiles[profile_key(model, endpoint)] = profile
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profiles, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def stratified_slice(all_questions, per_category, seed=0):
+    """카테고리마다 최대 per_category개 질문을 결정적으로 추출"""
+    by_category = {}
+    for q_name, q_data in all_questions.items():
+        by_category.setdefault(q_data.get("category"), []).append(q_name)
+
+    rng = random.Random(seed)
+    selected = []
+    for category in sorted(by_category, key=str):
+        names = by_category[category]
+        selected.extend(rng.sample(names, min(per_category, len(names))))
+    return {q_name: all_questions[q_name] for q_name in selected}
+
+
+def measure_config(questions, model, config, max_attempts=2):
+    """설정 하나로 slice를 평가해 처리량/파싱 실패율/정확도 측정"""
+    from evaluation_tools import iter_question_results
+
+    start_time = time.time()
+    answered = 0
+    correct = 0
+    for result in iter_question_results(questions, model,
+                                        n_questions=config["n_questions"],
+                                        max_attempts=max_attempts,
+                                        n_processes=config["n_processes"],
+                                        max_tokens=config["max_tokens"]):
+        # 실패한 배치의 질문과 응답에서 빠진 질문은 파싱 실패로 집계
+        if result.tested_answer != "Error: No answer":
+            answered += 1
+        correct += result.correct
+    elapsed_time = time.time() - start_time
+
+    return {
+        **config,
+        "questions_per_second": len(questions) / elapsed_time if elapsed_time > 0 else 0.0,
+        "parse_failure_rate": 1 - answered / len(questions),
+        "accuracy": correct / len(questions),
+        "elapsed": elapsed_time
+    }
+
+
+def _config_key(config):
+    return tuple(config[p] for p in TUNED_PARAMETERS)
+
+
+def grid_configs(grid):
+    configs = [{}]
+    for parameter in TUNED_PARAMETERS:
+        configs = [{**config, parameter: value} for config in configs for value in grid[parameter]]
+    return configs
+
+
+def is_acceptable(measurement, reference, max_parse_failure, max_accuracy_drift):
+    return (measurement["parse_failure_rate"] <= max_parse_failure
+            and abs(measurement["accuracy"] - reference["accuracy"]) <= max_accuracy_drift)
+
+
+def pick_best(measurements, reference, max_parse_failure, max_accuracy_drift):
+    """조건(파싱 실패율, 정확도 변화)을 만족하는 설정 중 처리량이 가장 높은 것"""
+    acceptable = [m for m in measurements if is_acceptable(m, reference, max_parse_failure, max_accuracy_drift)]
+    if not acceptable:
+        return reference
+    return max(acceptable, key=lambda m: m["questions_per_second"])
+
+
+def tune(questions, model, grid, search="grid", reference_config=None,
+         max_parse_failure=0.05, max_accuracy_drift=0.03, max_attempts=2):
+    """grid 또는 coordinate 탐색으로 설정들을 측정하고 (최적 측정값, 전체 측정값) 반환
+
+    coordinate 탐색은 파라미터 하나씩 후보를 바꿔 보며 최적 값을 고정해 나가므로
+    grid 전체 대신 후보 수의 합만큼만 실행합니다.
+    """
+    reference_config = reference_config or DEFAULT_CONFIG
+    measured = {}
+
+    def measure(config):
+        key = _config_key(config)
+        if key not in measured:
+            print(f"Measuring n_questions={config['n_questions']}, n_processes={config['n_processes']}, "
+                  f"max_tokens={config['max_tokens']}")
+            measured[key] = measure_config(questions, model, config, max_attempts)
+            m = measured[key]
+            print(f"  {m['questions_per_second']:.2f} q/s, parse failures {m['parse_failure_rate']:.1%}, "
+                  f"accuracy {m['accuracy']:.1%}")
+        return measured[key]
+
+    # 기준 설정을 먼저 측정 (정확도 변화 기준 + 캐시 예열)
+    reference = measure(reference_config)
+
+    if search == "grid":
+        for config in grid_configs(grid):
+            measure(config)
+    elif search == "coordinate":
+        best = reference
+        for parameter in TUNED_PARAMETERS:
+            for value in grid[parameter]:
+                measure({**{p: best[p] for p in TUNED_PARAMETERS}, parameter: value})
+            best = pick_best(list(measured.values()), reference, max_parse_failure, max_accuracy_drift)
+    else:
+        raise ValueError(f"Unknown search strategy: {search}")
+
+    measurements = list(measured.values())
+    return pick_best(measurements, reference, max_parse_failure, max_accuracy_drift), measurements
+
+
+def _int_list(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Tune batch size, concurrency and max_tokens for a vLLM deployment")
+    parser.add_argument("model")
+    parser.add_argument("--questions", default="TeleQnA.txt")
+    parser.add_argument("--per-category", type=int, default=20, help="Questions sampled per category")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--search", choices=("grid", "coordinate"), default="grid")
+    parser.add_argument("--batch-sizes", type=_int_list, default=[3, 5, 10])
+    parser.add_argument("--processes", type=_int_list, default=[2, 4, 8])
+    parser.add_argument("--max-tokens", type=_int_list, default=[1024, 2048, 4096])
+    parser.add_argument("--max-parse-failure", type=float, default=0.05)
+    parser.add_argument("--max-accuracy-drift", type=float, default=0.03)
+    parser.add_argument("--max-attempts", type=int, default=2)
+    parser.add_argument("--profile", default=None, help=f"Profile file (default: $VLLM_TUNING_PROFILE or {DEFAULT_PROFILE_PATH})")
+    args = parser.parse_args(argv)
+
+    from evaluation_tools import API_BASE_URL
+
+    with open(args.questions, encoding="utf-8") as f:
+        all_questions = json.load(f)
+    questions = stratified_slice(all_questions, args.per_category, args.seed)
+    del all_questions
+    print(f"Tuning {args.model} at {API_BASE_URL} on {len(questions)} questions ({args.search} search)")
+
+    grid = {"n_questions": args.batch_sizes, "n_processes": args.processes, "max_tokens": args.max_tokens}
+    best, measurements = tune(questions, args.model, grid, search=args.search,
+                              max_parse_failure=args.max_parse_failure,
+                              max_accuracy_drift=args.max_accuracy_drift,
+                              max_attempts=args.max_attempts)
+
+    reference = measurements[0]
+    print()
+    print(f"{'n_questions':>11} {'processes':>9} {'max_tokens':>10} {'q/s':>8} {'parse fail':>10} {'accuracy':>8}")
+    for m in sorted(measurements, key=lambda m: m["questions_per_second"], reverse=True):
+        marker = " *" if m is best else ""
+        print(f"{m['n_questions']:>11} {m['n_processes']:>9} {m['max_tokens']:>10} {m['questions_per_second']:>8.2f} "
+              f"{m['parse_failure_rate']:>10.1%} {m['accuracy']:>8.1%}{marker}")
+
+    profile = {
+        **{p: best[p] for p in TUNED_PARAMETERS},
+        "questions_per_second": best["questions_per_second"],
+        "parse_failure_rate": best["parse_failure_rate"],
+        "accuracy_drift": best["accuracy"] - reference["accuracy"],
+        "slice_size": len(questions),
+        "tuned_at": datetime.now().isoformat(timespec="seconds")
+    }
+    save_tuning_profile(args.model, API_BASE_URL, profile, args.profile)
+    print()
+    print(f"Saved profile for {profile_key(args.model, API_BASE_URL)} to {args.profile or profile_path()}: "
+          f"n_questions={profile['n_questions']}, n_processes={profile['n_processes']}, max_tokens={profile['max_tokens']}")
+
+
+if __name__ == "__main__":
+    main()